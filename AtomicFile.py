@@ -0,0 +1,23 @@
+import os
+import tempfile
+
+'''
+Writes a file through "write(temporaryPath)" and then moves it into place
+    so that concurrent readers (i.e. other sweep workers) never see a partial file
+The temporary file is created next to the target (keeping its extension), so the move never crosses file systems
+
+Arguments:
+    path -> Where the file ends up
+
+    write -> Function that writes the whole file to the path it is given
+'''
+def Store(path, write):
+    directory, name = os.path.split(path)
+    handle, temporary = tempfile.mkstemp(dir=directory or ".", suffix="-" + name)
+    os.close(handle)
+    try:
+        write(temporary)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
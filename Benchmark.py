@@ -0,0 +1,274 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy
+from numpy import *
+from DialogModel import DialogPOMDP, FactoredDialogPOMDP
+from Policy import Policy, FactoredPolicy
+from Simulator import Simulate
+
+# The control model lives in its own directory (with its own imports)
+CONTROL_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ControlModel")
+if CONTROL_DIRECTORY not in sys.path:
+    sys.path.append(CONTROL_DIRECTORY)
+import TrainingData
+from ControlModel import ControlModel
+
+'''
+Benchmarks every stage of the library on synthetic data and writes the results as JSON
+    Dialog stages -> Build, export, solve, policy lookup and simulation, for each question bank size
+    Control stages -> Training data conversion, model build and the per-frame belief update, for each training size
+Each result row holds the best time over the repeats, the peak traced memory and any output file size
+    Results of two versions can be compared with Compare (or "--baseline" on the command line)
+
+Usage:
+    python Benchmark.py --banks 6x3x10,20x3x500 --control 3x2000 --output results.json --baseline previous.json
+'''
+
+'''
+Returns a random question bank in the DialogPOMDP JSON layout (see DialogModel.py)
+    Each question affects a random quarter of the classes (at least one)
+'''
+def SyntheticBank(classes, observations, questions, seed=0):
+    rng = random.default_rng(seed)
+    labels = ["c" + str(category) for category in range(classes)]
+    observationLabels = ["o" + str(observation) for observation in range(observations)]
+    bank = {}
+    for question in range(questions):
+        affected = rng.choice(classes, size=int(maximum(1, classes // 4)), replace=False)
+        effect = {}
+        for category in affected.tolist():
+            probabilities = rng.dirichlet(ones(observations))
+            effect[labels[category]] = dict(zip(observationLabels, probabilities.tolist()))
+        bank["q" + str(question)] = {"English" : "Synthetic question " + str(question), "Effect" : effect}
+
+    return {
+        "Classifications" : labels,
+        "Observations" : observationLabels,
+        "Questions" : bank,
+        "Rewards" : {"Success" : 10, "Failure" : -30, "Question" : -1, "Wait" : -0.01},
+        "Time Discount" : 0.95,
+    }
+
+'''
+Returns an observation matrix (see DialogPOMDP) that reports the true observation with probability 1 - noise
+'''
+def SyntheticObservationMatrix(observations, noise=0.1):
+    return full((observations, observations), noise / maximum(1, observations - 1)) + eye(observations) * (1 - noise - noise / maximum(1, observations - 1))
+
+'''
+Writes a CSV recording (see TrainingData.Convert) with "windows" FFT windows per training frequency
+    The attended frequency is strong and the others are weak, with correlated noise on every bucket
+'''
+def SyntheticTraining(filename, frequencies, windows, seed=0):
+    means, mixing = _SyntheticClasses(frequencies)
+    rng = random.default_rng(seed)
+    with open(filename, "w") as f:
+        f.write(",".join(["frequency"] + [str(frequency) for frequency in frequencies]) + "\n")
+        for classIndex, frequency in enumerate(frequencies):
+            samples = means[classIndex] + rng.standard_normal((windows, len(frequencies))) @ mixing
+            f.write("".join([str(frequency) + "," + ",".join(map(repr, row)) + "\n" for row in samples.tolist()]))
+
+'''
+Returns full FFT windows (one per row, 1Hz buckets) drawn from the same classes as SyntheticTraining
+'''
+def SyntheticStream(frequencies, frames, seed=0):
+    means, mixing = _SyntheticClasses(frequencies)
+    rng = random.default_rng(seed)
+    classes = rng.integers(len(frequencies), size=frames)
+    stream = abs(rng.standard_normal((frames, int(max(frequencies)) + 1)))
+    stream[:, frequencies] = means[classes] + rng.standard_normal((frames, len(frequencies))) @ mixing
+    return stream
+
+def _SyntheticClasses(frequencies):
+    count = len(frequencies)
+    means = ones((count, count)) + 4 * eye(count)
+    mixing = eye(count) + 0.3 / count
+    return means, mixing
+
+'''
+Runs "function" a few times, returns (best seconds, peak traced bytes, result of the last run)
+    Memory is traced in one extra run, so the tracing overhead does not distort the times
+'''
+def _Measure(function, repeats=1, memory=True):
+    best = inf
+    for repeat in range(repeats):
+        startTime = time.perf_counter()
+        result = function()
+        best = minimum(best, time.perf_counter() - startTime)
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return float(best), peak, result
+
+'''
+Benchmarks the dialog stages on one synthetic question bank, returns the result rows
+'''
+def BenchmarkDialog(classes, observations, questions, directory, repeats=1, memory=True, iterations=5, lookups=100000, episodes=1000):
+    size = "%dx%dx%d" % (classes, observations, questions)
+    rows = []
+    def add(stage, seconds, peak, **extra):
+        row = {"Benchmark" : "dialog", "Size" : size, "Stage" : stage, "Seconds" : seconds, "PeakBytes" : peak}
+        row.update(extra)
+        rows.append(row)
+
+    bankPath = os.path.join(directory, "bank-" + size + ".json")
+    with open(bankPath, "w") as f:
+        json.dump(SyntheticBank(classes, observations, questions), f)
+    observeProb = SyntheticObservationMatrix(observations)
+
+    seconds, peak, dialog = _Measure(lambda: DialogPOMDP(bankPath, observeProb), repeats, memory)
+    add("Build", seconds, peak, States=len(dialog._States), Actions=len(dialog._Actions))
+    seconds, peak, factored = _Measure(lambda: FactoredDialogPOMDP(bankPath, observeProb), repeats, memory)
+    add("BuildFactored", seconds, peak, Modes=factored.NumModes, Actions=factored.NumActions)
+
+    pomdpPath = os.path.join(directory, "bank-" + size + ".pomdp")
+    seconds, peak, _ = _Measure(lambda: dialog.GenerateFile(pomdpPath), repeats, memory)
+    add("GenerateFile", seconds, peak, FileBytes=os.path.getsize(pomdpPath))
+    seconds, peak, _ = _Measure(lambda: factored.GenerateFile(pomdpPath), repeats, memory)
+    add("GenerateFileFactored", seconds, peak, FileBytes=os.path.getsize(pomdpPath))
+    os.remove(pomdpPath)
+
+    # A fixed number of iterations, so the times compare across versions
+    seconds, peak, (planes, actions) = _Measure(lambda: dialog.Solve(precision=0, maxIterations=iterations, beliefCount=200, seed=0), repeats, memory)
+    add("Solve", seconds, peak, Iterations=iterations, Planes=planes.shape[1])
+    seconds, peak, (factoredPlanes, factoredActions, factoredModes) = _Measure(lambda: factored.Solve(precision=0, maxIterations=iterations, beliefCount=200, seed=0), repeats, memory)
+    add("SolveFactored", seconds, peak, Iterations=iterations, Planes=factoredPlanes.shape[1])
+
+    # Lookups of general beliefs (the policy pads them with zeros)
+    policy = Policy(planes, actions)
+    factoredPolicy = FactoredPolicy(factoredPlanes, factoredActions, factoredModes)
+    beliefs = random.default_rng(0).dirichlet(ones(classes), size=lookups)
+    seconds, peak, _ = _Measure(lambda: policy.BestAction(beliefs), repeats, memory)
+    add("PolicyLookup", seconds, peak, Lookups=lookups)
+    seconds, peak, _ = _Measure(lambda: factoredPolicy.BestAction(factored.GENERAL_MODE, beliefs), repeats, memory)
+    add("FactoredPolicyLookup", seconds, peak, Lookups=lookups)
+
+    seconds, peak, _ = _Measure(lambda: Simulate(factored, factoredPolicy, episodes=episodes, seed=0, workers=1), repeats, memory)
+    add("SimulateFactored", seconds, peak, Episodes=episodes)
+    return rows
+
+'''
+Benchmarks the control stages on synthetic training data, returns the result rows
+'''
+def BenchmarkControl(classes, windows, directory, repeats=1, memory=True, frames=10000):
+    size = "%dx%d" % (classes, windows)
+    rows = []
+    def add(stage, seconds, peak, **extra):
+        row = {"Benchmark" : "control", "Size" : size, "Stage" : stage, "Seconds" : seconds, "PeakBytes" : peak}
+        row.update(extra)
+        rows.append(row)
+
+    frequencies = [12 + 2 * classIndex for classIndex in range(classes)]
+    csvPath = os.path.join(directory, "training-" + size + ".csv")
+    fftPath = os.path.join(directory, "training-" + size + ".fft")
+    SyntheticTraining(csvPath, frequencies, windows)
+
+    seconds, peak, _ = _Measure(lambda: TrainingData.Convert(csvPath, fftPath), repeats, memory)
+    add("ConvertTraining", seconds, peak, FileBytes=os.path.getsize(fftPath))
+    seconds, peak, model = _Measure(lambda: ControlModel(fftPath, seed=0), repeats, memory)
+    add("Build", seconds, peak)
+
+    # Per-frame latency of the control loop (nothing should be allocated while streaming)
+    stream = SyntheticStream(frequencies, frames)
+    def run():
+        for action in model.Stream(stream):
+            pass
+        return model.Log["latency"].Contents()[1]
+    seconds, peak, latencies = _Measure(run, repeats, memory)
+    latencies = latencies[-int(minimum(frames, len(latencies))):]
+    add("Update", seconds, peak, Frames=frames, MeanLatency=float(latencies.mean()),
+        P99Latency=float(percentile(latencies, 99)), MaxLatency=float(latencies.max()))
+    return rows
+
+'''
+Runs every benchmark and returns the results (see the module description), writing them to "output" if given
+'''
+def Run(banks=((6, 3, 10),), controls=((3, 2000),), output=None, repeats=1, memory=True):
+    directory = tempfile.mkdtemp(prefix="pomdpy-benchmark-")
+    results = []
+    try:
+        for classes, observations, questions in banks:
+            results.extend(BenchmarkDialog(classes, observations, questions, directory, repeats, memory))
+        for classes, windows in controls:
+            results.extend(BenchmarkControl(classes, windows, directory, repeats, memory))
+    finally:
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+    report = {"Version" : _Version(), "Results" : results}
+    if output is not None:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=4, sort_keys=True)
+    return report
+
+'''
+Returns the rows of "current" that are slower (or use more memory) than in "baseline" by more than "tolerance" times
+    Both arguments are results of Run, or paths of their JSON files
+    Stages that took less than "minimumSeconds" in the baseline are too noisy to compare times
+'''
+def Compare(baseline, current, tolerance=1.5, minimumSeconds=0.01):
+    if isinstance(baseline, str):
+        with open(baseline, "r") as f:
+            baseline = json.load(f)
+    if isinstance(current, str):
+        with open(current, "r") as f:
+            current = json.load(f)
+
+    previous = dict(((row["Benchmark"], row["Size"], row["Stage"]), row) for row in baseline["Results"])
+    regressions = []
+    for row in current["Results"]:
+        old = previous.get((row["Benchmark"], row["Size"], row["Stage"]))
+        if old is None:
+            continue
+        for measure in ["Seconds", "PeakBytes"]:
+            if measure == "Seconds" and old[measure] < minimumSeconds:
+                continue
+            if row.get(measure) is not None and old.get(measure) and row[measure] > tolerance * old[measure]:
+                regressions.append({"Benchmark" : row["Benchmark"], "Size" : row["Size"], "Stage" : row["Stage"],
+                                    "Measure" : measure, "Baseline" : old[measure], "Current" : row[measure]})
+    return regressions
+
+def _Version():
+    try:
+        revision = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                  stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {"Revision" : revision, "Python" : platform.python_version(), "NumPy" : numpy.__version__,
+            "Platform" : platform.platform(), "Time" : time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def _Sizes(text):
+    return [tuple(int(value) for value in size.split("x")) for size in text.split(",") if size]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the model build, export, solve and control loop on synthetic data")
+    parser.add_argument("--banks", default="6x3x10,20x3x200", help="Question banks as <classes>x<observations>x<questions>, comma separated")
+    parser.add_argument("--control", default="3x2000", help="Control models as <classes>x<windows per class>, comma separated")
+    parser.add_argument("--repeats", type=int, default=1, help="Times are the best of this many runs")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the traced runs that measure peak memory")
+    parser.add_argument("--output", default="benchmark.json", help="Where the results are written")
+    parser.add_argument("--baseline", help="Results of a previous version to compare against")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Slowdown factor that counts as a regression")
+    arguments = parser.parse_args()
+
+    report = Run(_Sizes(arguments.banks), _Sizes(arguments.control), arguments.output, arguments.repeats, not arguments.no_memory)
+    for row in report["Results"]:
+        print("%-8s %-12s %-22s %10.4f s %14s bytes" % (row["Benchmark"], row["Size"], row["Stage"], row["Seconds"], row["PeakBytes"]))
+
+    if arguments.baseline is not None:
+        regressions = Compare(arguments.baseline, report, arguments.tolerance)
+        for regression in regressions:
+            print("Regression: %(Benchmark)s %(Size)s %(Stage)s %(Measure)s %(Baseline)s -> %(Current)s" % regression)
+        sys.exit(1 if regressions else 0)
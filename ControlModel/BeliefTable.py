@@ -0,0 +1,161 @@
+import hashlib
+import itertools
+import os
+from numpy import *
+import AtomicFile
+
+# Bump this whenever the layout of the compiled tables changes, so that stale files are never reused
+TABLE_VERSION = 2
+
+# Number of grid corners evaluated at once while compiling
+CHUNK_CORNERS = 65536
+
+# Slack for rounding when testing whether a grid corner lies inside the belief simplex
+SIMPLEX_TOLERANCE = 1e-9
+
+class BeliefTable:
+
+    '''
+    Precompiled best action for every cell of a grid over the belief simplex
+    The first (# of classes - 1) belief entries are cut into "resolution" steps each (the last entry is implied)
+        The steps get finer towards 0 and 1 (see _GridPoints), since confident beliefs pile up next to the simplex corners
+        and decision boundaries (ie. between waiting and acting) often lie very close to them
+        A cell is only given an action when the same alpha vector is best at every vertex of the part of the cell inside the simplex
+        Since each vector is linear in the belief, that vector is then best everywhere in that part
+        Cells that straddle a decision boundary hold -1, and the caller falls back to evaluating the alpha vectors
+    A lookup costs O(# of classes), no matter how many alpha vectors the policy has
+
+    Arguments:
+        planes -> 2D matrix, one column (alpha vector) per plane, one row per class
+
+        actions -> 1D array, the index of the action for each plane
+
+        resolution -> Number of steps along each belief entry
+    '''
+    def __init__(self, planes, actions, resolution):
+        planes = asarray(planes, dtype=float64)
+        actions = asarray(actions)
+        classCount = planes.shape[0]
+        assert classCount >= 2
+        assert resolution >= 1
+        assert int(actions.max()) < 127
+
+        self.Resolution = resolution
+        self._Table = _Compile(planes, actions, resolution)
+        self._Setup(classCount)
+
+    '''
+    Returns the table for a policy, compiling it only if it is not stored in "cacheDirectory" yet
+        Tables are named after the planes, actions and resolution, so they can be reused between sessions
+    '''
+    @staticmethod
+    def Load(planes, actions, resolution, cacheDirectory):
+        planes = ascontiguousarray(planes, dtype=float64)
+        actions = ascontiguousarray(actions, dtype=int64)
+        digest = hashlib.sha256()
+        digest.update(str((TABLE_VERSION, planes.shape, resolution)).encode())
+        digest.update(planes.tobytes())
+        digest.update(actions.tobytes())
+        path = os.path.join(cacheDirectory, digest.hexdigest() + ".table.npy")
+
+        if os.path.exists(path):
+            # Read completely (not memory-mapped), so that lookups never wait on the disk
+            table = BeliefTable.__new__(BeliefTable)
+            table.Resolution = resolution
+            table._Table = load(path)
+            table._Setup(planes.shape[0])
+            return table
+
+        table = BeliefTable(planes, actions, resolution)
+        os.makedirs(cacheDirectory, exist_ok=True)
+        AtomicFile.Store(path, lambda temporary: save(temporary, table._Table))
+        return table
+
+    '''
+    Fraction of the cells inside the simplex that hold an action (the rest fall back to the alpha vectors)
+    '''
+    @property
+    def Coverage(self):
+        classCount = len(self._Strides)
+        lower = _GridPoints(self.Resolution)[indices((self.Resolution,) * (classCount - 1))].sum(axis=0)
+        inside = lower.reshape(self._Table.shape) <= 1 + SIMPLEX_TOLERANCE
+        return float(count_nonzero(self._Table[inside] >= 0)) / maximum(1, count_nonzero(inside))
+
+    '''
+    Returns the action of the cell holding the belief, or -1 if the alpha vectors have to be evaluated
+    Does not allocate any arrays, so it is safe for the control loop
+    '''
+    def Lookup(self, belief):
+        # Inverse of _GridPoints
+        multiply(belief, -2.0, out=self._Scaled)
+        add(self._Scaled, 1.0, out=self._Scaled)
+        clip(self._Scaled, -1.0, 1.0, out=self._Scaled)
+        arccos(self._Scaled, out=self._Scaled)
+        multiply(self._Scaled, self.Resolution / pi, out=self._Scaled)
+        floor(self._Scaled, out=self._Scaled)
+        minimum(self._Scaled, self.Resolution - 1, out=self._Scaled)
+        return int(self._FlatTable[int(dot(self._Scaled, self._Strides))])
+
+    def _Setup(self, classCount):
+        self._FlatTable = self._Table.reshape(-1)
+        self._Scaled = zeros(classCount)
+
+        # The last belief entry is implied, so it has no stride
+        self._Strides = zeros(classCount)
+        self._Strides[0:(classCount - 1)] = self.Resolution ** arange(classCount - 2, -1, -1)
+
+'''
+Returns the "resolution + 1" grid positions along each belief entry, from 0 to 1
+    Chebyshev spacing, so the first and last steps are about (pi / resolution)^2 / 4 instead of 1 / resolution
+'''
+def _GridPoints(resolution):
+    return (1 - cos(pi * arange(resolution + 1) / resolution)) / 2
+
+'''
+Returns the table of actions (-1 for undecided cells), one axis per free belief entry
+'''
+def _Compile(planes, actions, resolution):
+    classCount, planeCount = planes.shape
+    dimensions = classCount - 1
+    grid = _GridPoints(resolution)
+
+    # Each plane as an affine function of the free entries
+    #   value = planes[-1] + sum over i of belief[i] * (planes[i] - planes[-1])
+    slopes = planes[0:dimensions, :] - planes[dimensions, :]
+    offsets = planes[dimensions, :]
+
+    # Best plane at every corner of the grid, and whether the corner lies inside the simplex
+    cornerCount = (resolution + 1) ** dimensions
+    best = empty(cornerCount, dtype=int32)
+    inside = empty(cornerCount, dtype=bool)
+    for start in range(0, cornerCount, CHUNK_CORNERS):
+        corners = grid[column_stack(unravel_index(arange(start, int(minimum(start + CHUNK_CORNERS, cornerCount))), (resolution + 1,) * dimensions))]
+        best[start:(start + len(corners))] = argmax(offsets + corners @ slopes, axis=1)
+        inside[start:(start + len(corners))] = corners.sum(axis=1) <= 1 + SIMPLEX_TOLERANCE
+    best = best.reshape((resolution + 1,) * dimensions)
+    inside = inside.reshape(best.shape)
+
+    # A cell is decided when all of its corners inside the simplex share the same best plane
+    #   Cells whose lowest corner is outside the simplex are never looked up
+    lowest = best[(slice(0, resolution),) * dimensions]
+    decided = inside[(slice(0, resolution),) * dimensions].copy()
+    whole = decided.copy()
+    for corner in itertools.product([0, 1], repeat=dimensions):
+        shifted = tuple(slice(step, step + resolution) for step in corner)
+        decided &= (best[shifted] == lowest) | ~inside[shifted]
+        whole &= inside[shifted]
+
+    # Where the simplex cuts through a cell, the points where it crosses the cell's edges are vertices too
+    cut = flatnonzero(decided & ~whole)
+    cells = column_stack(unravel_index(cut, lowest.shape))
+    for corner in itertools.product([0, 1], repeat=dimensions):
+        upper = grid[cells + array(corner)]
+        for axis in flatnonzero(array(corner)).tolist():
+            lower = upper.copy()
+            lower[:, axis] = grid[cells[:, axis]]
+            crossing = (lower.sum(axis=1) <= 1 + SIMPLEX_TOLERANCE) & (upper.sum(axis=1) > 1 + SIMPLEX_TOLERANCE)
+            lower[:, axis] += 1 - lower.sum(axis=1)
+            differs = argmax(offsets + lower @ slopes, axis=1) != lowest.reshape(-1)[cut]
+            decided.reshape(-1)[cut[crossing & differs]] = False
+
+    return where(decided, actions[lowest], -1).astype(int8)
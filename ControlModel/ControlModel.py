@@ -1,5 +1,22 @@
+import gc
+import os
+import sys
+import threading
+import time
 from numpy import *
 import TrainingData
+from RingBuffer import RingBuffer
+from RunningGaussian import RunningGaussian
+
+# The alpha vector policy is shared with the dialog model, whose modules live one directory up
+ROOT_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+if ROOT_DIRECTORY not in sys.path:
+    sys.path.append(ROOT_DIRECTORY)
+from BeliefTable import BeliefTable
+import Profiling
+from Policy import Policy
+from SparseTransition import DeterministicTransition
+from Solver import PointBasedSolver
 
 class ControlModel:
     # Constants
@@ -11,46 +28,579 @@ class ControlModel:
     STRATA_PER_CLASS = 7
     OBS_CARDINALITY = 15
     BOLTZMANN_TEMPERATURE = 1.3
+
+    # Discretization of the observation model (see _CalculateObservationPosteriors)
+    MAX_GRID_POINTS = 1000000
+    MAX_COVAR_STEPS = 3
+    GRID_CHUNK_POINTS = 65536
+
+    # Number of entries kept in each of the logs (observations, confidences, actions, ...)
+    LOG_CAPACITY = 4096
     
-    def __init__(self, trainingFile):
-        _CalculateObservationPosteriors(trainingFile)
+    # Stopping conditions for the in-process POMDP solver (see Solver.py)
+    SOLVER_PRECISION = 0.001
+    SOLVER_TIMEOUT = 10
+    
+    # Default size of the action lookup table (see UseLookupTable)
+    LOOKUP_CELLS = 1 << 20
+    
+    def __init__(self, trainingFile, seed=None):
+        self._CalculateObservationPosteriors(trainingFile)
         
         # Define the actions and states of the POMDP
-        # self.Actions = ['yes', 'wait', 'no']
-        # self.States = ['yes', 'wait', 'no']
-        
-        # Each state is equally likely at first (uniform prior)
-        # self.belief = ones(len(self.States)) / len(self.States)
+        #   There is one brain state per trained frequency (class) and one classified state per control
+        #   The policy may classify into any of the controls, or wait for more observations
+        self.Controls = ['left', 'center', 'right']
+        self.Actions = ['a_' + control for control in self.Controls] + ['a_wait']
+        self.States = ['s_' + str(frequency) for frequency in self.Frequencies] + ['s_' + control for control in self.Controls]
         
-        # ~~~ Not sure what this does yet
         # Reinforcement Learning reward function
         #   Incentivize initial exploration by setting ExpectedReward[Control, State] above the wait penalty
-        self.ExpectedRewards  = -3 * ones((len(self.Actions), len(self.States))) 
-        self.ExpectedRewards +=  4 * eye(len(self.States))
+        self.ExpectedRewards  = -3 * ones((len(self.Controls), len(self.Frequencies))) 
+        self.ExpectedRewards +=  4 * eye(len(self.Controls), len(self.Frequencies))
+        
+        self.Policy = None
+        self._LookupResolution = None
+        self._LookupCache = None
+        self._Random = random.default_rng(seed)
+        self._PrepareStreaming()
+        
+        # Calculate the initial policy (the control loop cannot run without one)
+        self._BuildModel(seed)
+        self._Replan()
+        self._RaiseReplanError()
     
+    @Profiling.Timed("ControlModel.ObservationModel")
     def _CalculateObservationPosteriors(self, trainingFile):
         # Fetch and parse the training data into a set of means and covariances
         rawData = TrainingData.DataWrapper(trainingFile)
         classifications = rawData.GetFrequencies()
         classCount = len(classifications)
-        
-        means = [];
-        covariances = [];
-        for i in range(classCount):
-            tuples = rawData.GetFrequency(classifications[i])
-            means.append(mean(tuples))
-            covariances.append(cov(tuples))
-        
-        # Use the means and covariances to fill in a probability density grid
-        MAX_GRID_POINTS = 1000000
-        gridResolution = int(MAX_GRID_POINTS ** (1.0 / classCount))
-        
-        # First calculate the numerical bounds of the grid
-        #   Expand a [hyper]rectangul around each of the means 
-        #     The size of the [hyper]rectangle is based on the main covariance terms
-        #   Then wrap a bounding [hyper]square around all the [hyper]rectangles
-        MAX_COVAR_STEPS = 3
-        lower = float("inf")
-        upper = float("-inf")
+
+        # The data is read a chunk at a time (it may be a memory-mapped file far larger than RAM)
+        #   Each class keeps a streaming estimate, so it can also adapt to new windows during a session
+        self._ClassModels = []
         for i in range(classCount):
-            covariances[i]
\ No newline at end of file
+            self._ClassModels.append(RunningGaussian.FromChunks(rawData.IterateFrequency(classifications[i]),
+                                                                rawData.GetFrequency(classifications[i]).shape[1]))
+        means = [model.Mean for model in self._ClassModels]
+        covariances = [model.Covariance() for model in self._ClassModels]
+
+        self.Frequencies = classifications
+        self.Means = array(means)
+        self.Covariances = array(covariances)
+
+        # Each frequency's FFT bucket is the observed feature for that class
+        self.FrequencyBins = array(classifications, dtype=intp)
+        
+        # Discretize the continuous observations into a small set of observation labels
+        #   ObservationProbabilities[Observation, Class] = P(observation | class)
+        self.ObservationProbabilities = DiscretizeObservations(self.Means, self.Covariances,
+                                                               self.STRATA_PER_CLASS, self.OBS_CARDINALITY,
+                                                               self.MAX_GRID_POINTS, self.MAX_COVAR_STEPS, self.GRID_CHUNK_POINTS)
+
+
+    '''
+    Precomputes everything the per-frame belief update needs
+        The Cholesky factors and log-normalizers of the class Gaussians
+        Buffers for every intermediate result, so that a frame never allocates
+    '''
+    def _PrepareStreaming(self):
+        classCount = len(self.Frequencies)
+        self._InverseFactors, self._LogNormalizers = _GaussianFactors(self.Means, self.Covariances)
+        
+        self.Belief = ones(classCount) / classCount
+        self._LogBelief = log(self.Belief)
+        self._Observation = zeros(self.Means.shape[1])
+        self._Offsets = zeros(self.Means.shape)
+        self._Whitened = zeros(self.Means.shape)
+        self._LogLikelihoods = zeros(classCount)
+        self._Confidence = zeros(classCount)
+        self._ControlQualities = zeros(len(self.Controls))
+        
+        self.LastActionIndex = len(self.Actions) - 1
+        self.LastControlIndex = None    # Only set by controls (not waits), this is what feedback refers to
+        self.LastClassIndex = None
+        self.LastConfidence = 0.0
+        self.Overruns = 0
+        self.LookupFallbacks = 0
+        
+        # Bounded logs (see doControl33.m for the unbounded originals)
+        self.Log = {
+            "observation" : RingBuffer(self.LOG_CAPACITY), 
+            "confidence"  : RingBuffer(self.LOG_CAPACITY, (classCount,)), 
+            "belief"      : RingBuffer(self.LOG_CAPACITY, (classCount,)), 
+            "actionMade"  : RingBuffer(self.LOG_CAPACITY, (), intp), 
+            "latency"     : RingBuffer(self.LOG_CAPACITY, ()), 
+        }
+    
+    '''
+    Adds a labeled FFT window to the class Gaussians (i.e. after the user confirms what they attended)
+    Costs O(d^2) for the estimate plus a refactorization of one small covariance, nothing is refit from scratch
+    Call it from the same thread as Update
+    
+    Arguments:
+        frequency -> The training frequency the user was attending
+        
+        fftData -> 1D array in the frequency domain, same as for Update
+    '''
+    def AddTrainingWindow(self, frequency, fftData):
+        classIndex = list(self.Frequencies).index(frequency)
+        model = self._ClassModels[classIndex]
+        model.Update(take(fftData, self.FrequencyBins))
+        
+        # Refresh the class in place, so the streaming buffers stay valid
+        self.Means[classIndex] = model.Mean
+        self.Covariances[classIndex] = model.Covariance()
+        inverseFactors, logNormalizers = _GaussianFactors(self.Means[classIndex:(classIndex + 1)], self.Covariances[classIndex:(classIndex + 1)])
+        self._InverseFactors[classIndex] = inverseFactors[0]
+        self._LogNormalizers[classIndex] = logNormalizers[0]
+    
+    '''
+    Installs a policy for the control loop (see Policy.py)
+    The policy tables are swapped in a single assignment, so this is safe while a stream is running
+    '''
+    def SetPolicy(self, policy):
+        # The classified states are never occupied while running, so only the brain state rows are used
+        planes = ascontiguousarray(policy.Planes[0:len(self.Frequencies), :], dtype=float64)
+        actions = asarray(policy.Actions)
+        table = None
+        if self._LookupResolution is not None:
+            if self._LookupCache is None:
+                table = BeliefTable(planes, actions, self._LookupResolution)
+            else:
+                table = BeliefTable.Load(planes, actions, self._LookupResolution, self._LookupCache)
+        self._PolicyTables = (planes, actions, zeros(planes.shape[1]), table)
+        self.Policy = policy
+    
+    def LoadPolicy(self, filename, cacheDirectory=None):
+        self.SetPolicy(Policy.Load(filename, cacheDirectory))
+    
+    '''
+    Precompiles every policy (the current one and any re-solved later) into a lookup table over the belief simplex
+    Each frame then looks its action up in O(# of classes), and only beliefs near a decision boundary
+        evaluate the alpha vectors (counted in self.LookupFallbacks), see BeliefTable.py
+    
+    Arguments:
+        enabled -> False goes back to evaluating the alpha vectors on every frame
+                   Models with a single frequency never use a table
+        
+        resolution -> Number of steps along each belief entry, the table has resolution^(# of classes - 1) cells
+                      None picks the finest resolution that keeps the table within LOOKUP_CELLS cells
+        
+        cacheDirectory -> Optional directory where compiled tables are kept between sessions
+    '''
+    def UseLookupTable(self, enabled=True, resolution=None, cacheDirectory=None):
+        # With a single frequency the belief never changes, so there is nothing to look up
+        if len(self.Frequencies) < 2:
+            enabled = False
+        elif resolution is None:
+            resolution = int(floor(self.LOOKUP_CELLS ** (1.0 / (len(self.Frequencies) - 1)) + 1e-9))
+        self._LookupResolution = resolution if enabled else None
+        self._LookupCache = cacheDirectory
+        if self.Policy is not None:
+            self.SetPolicy(self.Policy)
+    
+    '''
+    Sets up the POMDP that the policy is solved for (see generateModel33.m)
+        Brain states stay put while waiting and move to the classified state of a control when it is chosen
+        Classified states stay put no matter what
+    '''
+    def _BuildModel(self, seed=None):
+        brainStateCount = len(self.Frequencies)
+        controlCount = len(self.Controls)
+        stateCount = len(self.States)
+        
+        transitions = [DeterministicTransition(stateCount, arange(brainStateCount), repeat(brainStateCount + control, brainStateCount)) 
+                       for control in range(controlCount)]
+        transitions.append(DeterministicTransition(stateCount))
+        
+        # Observations are only informative in the brain states
+        observationMatrix = ones((stateCount, self.ObservationProbabilities.shape[0])) / self.ObservationProbabilities.shape[0]
+        observationMatrix[0:brainStateCount, :] = self.ObservationProbabilities.T
+        
+        initialBelief = zeros(stateCount)
+        initialBelief[0:brainStateCount] = 1.0 / brainStateCount
+        
+        # Classifying earns the expected reward of the control, waiting costs a little, nothing happens once classified
+        rewardMatrix = zeros((len(self.Actions), stateCount))
+        rewardMatrix[0:controlCount, 0:brainStateCount] = self.ExpectedRewards
+        rewardMatrix[controlCount, 0:brainStateCount] = self.WAIT_PENALTY
+        
+        self._Solver = PointBasedSolver(transitions, observationMatrix, rewardMatrix, self.TIME_DISCOUNT, initialBelief, seed=seed)
+        self._PendingRewardDelta = zeros(rewardMatrix.shape)
+        self._ReplanLock = threading.Lock()
+        self._ReplanThread = None
+        self._ReplanError = None
+        
+        self.Log["expectedRewards"] = RingBuffer(self.LOG_CAPACITY, self.ExpectedRewards.shape)
+        self.Log["feedback"] = RingBuffer(self.LOG_CAPACITY)
+    
+    '''
+    Re-solves the POMDP until no reward changes are pending, starting from the last solved policy
+    Each solved policy is installed as soon as it is ready
+        An error is kept and raised by the next WaitForPolicy or GiveFeedback, the thread always clears itself
+    '''
+    @Profiling.Timed("ControlModel.Replan")
+    def _Replan(self):
+        rewardDelta = None
+        try:
+            while True:
+                with self._ReplanLock:
+                    rewardDelta = self._PendingRewardDelta
+                    self._PendingRewardDelta = zeros(rewardDelta.shape)
+                
+                self._Solver.UpdateRewards(rewardDelta)
+                rewardDelta = None
+                planes, actions = self._Solver.Solve(precision=self.SOLVER_PRECISION, timeout=self.SOLVER_TIMEOUT)
+                self.SetPolicy(Policy(planes, actions))
+                
+                with self._ReplanLock:
+                    if not self._PendingRewardDelta.any():
+                        self._ReplanThread = None
+                        return
+        except Exception as error:
+            with self._ReplanLock:
+                self._ReplanError = error
+                # Feedback that never reached the solver is kept for the next re-solve
+                if rewardDelta is not None:
+                    self._PendingRewardDelta += rewardDelta
+        finally:
+            with self._ReplanLock:
+                if self._ReplanThread is threading.current_thread():
+                    self._ReplanThread = None
+    
+    '''
+    Raises (and clears) the error of a failed background re-solve, if there was one
+    '''
+    def _RaiseReplanError(self):
+        with self._ReplanLock:
+            error = self._ReplanError
+            self._ReplanError = None
+        if error is not None:
+            raise error
+    
+    '''
+    Updates the expected rewards with the user's feedback on the last control (see giveFeedback33.m)
+    The policy is re-solved in a background thread, the control loop keeps using the old policy until then
+    A failed earlier re-solve raises its error here, before the feedback is applied
+    
+    Arguments:
+        feedbackBoolean -> True when the last control was the one the user wanted
+    '''
+    def GiveFeedback(self, feedbackBoolean):
+        assert self.LastControlIndex is not None, "There is no control to give feedback on yet"
+        self._RaiseReplanError()
+        if feedbackBoolean:
+            feedback = self.CORRECT_REWARD
+        else:
+            feedback = self.WRONG_PENALTY
+        
+        # A negative feedback only affects the one element of the reward matrix
+        learningFactor = self.LEARNING_RATE * self.LastConfidence
+        oldRewards = self.ExpectedRewards.copy()
+        self.ExpectedRewards[self.LastControlIndex, self.LastClassIndex] += learningFactor * (feedback - self.ExpectedRewards[self.LastControlIndex, self.LastClassIndex])
+        
+        # Else we also have to negatively enforce all the other elements in the same row and column
+        if feedbackBoolean:
+            mask = zeros(self.ExpectedRewards.shape)
+            mask[:, self.LastClassIndex] = 1
+            mask[self.LastControlIndex, :] = 1
+            mask[self.LastControlIndex, self.LastClassIndex] = 0
+            self.ExpectedRewards += mask * (learningFactor * (self.WRONG_PENALTY * mask - self.ExpectedRewards))
+        
+        theTime = time.time()
+        self.Log["expectedRewards"].Append(theTime, self.ExpectedRewards)
+        self.Log["feedback"].Append(theTime, feedback)
+        
+        # Only the change in rewards is handed to the solver
+        with self._ReplanLock:
+            self._PendingRewardDelta[0:len(self.Controls), 0:len(self.Frequencies)] += self.ExpectedRewards - oldRewards
+            if self._ReplanThread is None:
+                self._ReplanThread = threading.Thread(target=self._Replan)
+                self._ReplanThread.daemon = True
+                self._ReplanThread.start()
+    
+    '''
+    Blocks until any background re-solve has finished (or the timeout in seconds passes)
+    Raises the error of a background re-solve that failed
+    '''
+    def WaitForPolicy(self, timeout=None):
+        thread = self._ReplanThread
+        if thread is not None:
+            thread.join(timeout)
+        self._RaiseReplanError()
+    
+    '''
+    Consumes one FFT window and returns the label of the action to take (see doControl33.m)
+    
+    Arguments:
+        fftData -> 1D array (or list) in the frequency domain, fftData[i] is the 1Hz wide bucket for i Hz
+                   Float64 arrays are the fastest, since they are used without any conversion
+        
+        latencyBudget -> Optional number of seconds this frame may take
+                         Once the action is decided past the budget, the frame skips logging its belief, observation,
+                         confidence and action (the latency is still logged), so a slow frame does not get any slower
+                         Frames that take longer are counted in self.Overruns
+    '''
+    def Update(self, fftData, latencyBudget=None):
+        startTime = time.perf_counter()
+        planes, planeActions, scores, table = self._PolicyTables
+        
+        # Get the observation vector
+        #   Float64 arrays are gathered straight into the buffer, anything else (lists, float32, ints) is converted on the way
+        fftData = asarray(fftData)
+        if fftData.dtype == float64:
+            take(fftData, self.FrequencyBins, out=self._Observation)
+        else:
+            self._Observation[:] = fftData[self.FrequencyBins]
+        
+        # Determine log P(Ot|Ct) for each class
+        subtract(self._Observation, self.Means, out=self._Offsets)
+        einsum("kij,kj->ki", self._InverseFactors, self._Offsets, out=self._Whitened)
+        square(self._Whitened, out=self._Whitened)
+        self._Whitened.sum(axis=1, out=self._LogLikelihoods)
+        multiply(self._LogLikelihoods, -0.5, out=self._LogLikelihoods)
+        add(self._LogLikelihoods, self._LogNormalizers, out=self._LogLikelihoods)
+        
+        # Normalized P(Ot|Ct), only kept for the logs
+        subtract(self._LogLikelihoods, self._LogLikelihoods.max(), out=self._Confidence)
+        exp(self._Confidence, out=self._Confidence)
+        divide(self._Confidence, self._Confidence.sum(), out=self._Confidence)
+        
+        # Update the belief in log space, so that long runs of confident observations cannot underflow
+        add(self._LogBelief, self._LogLikelihoods, out=self._LogBelief)
+        subtract(self._LogBelief, self._LogBelief.max(), out=self._LogBelief)
+        exp(self._LogBelief, out=self.Belief)
+        total = self.Belief.sum()
+        divide(self.Belief, total, out=self.Belief)
+        subtract(self._LogBelief, log(total), out=self._LogBelief)
+        
+        # Determine the optimal action given the policy
+        #   The lookup table (if any) decides most beliefs without touching the alpha vectors
+        actionIndex = -1
+        if table is not None:
+            actionIndex = table.Lookup(self.Belief)
+        if actionIndex < 0:
+            if table is not None:
+                self.LookupFallbacks += 1
+            dot(self.Belief, planes, out=scores)
+            actionIndex = int(planeActions[scores.argmax()])
+        
+        theTime = time.time()
+        logging = latencyBudget is None or time.perf_counter() - startTime <= latencyBudget
+        if logging:
+            self.Log["belief"].Append(theTime, self.Belief)
+        
+        if actionIndex != len(self.Actions) - 1:
+            # Softmax action selection over the controls
+            #   Weight the expected reward of each control by the belief, then apply the Boltzmann distribution
+            dot(self.ExpectedRewards, self.Belief, out=self._ControlQualities)
+            subtract(self._ControlQualities, self._ControlQualities.max(), out=self._ControlQualities)
+            divide(self._ControlQualities, self.BOLTZMANN_TEMPERATURE, out=self._ControlQualities)
+            exp(self._ControlQualities, out=self._ControlQualities)
+            cumsum(self._ControlQualities, out=self._ControlQualities)
+            actionIndex = int(searchsorted(self._ControlQualities, self._Random.random() * self._ControlQualities[-1]))
+            
+            self.LastControlIndex = actionIndex
+            self.LastClassIndex = int(self.Belief.argmax())
+            self.LastConfidence = float(self.Belief.max())
+            
+            # Start over with a uniform belief
+            self.Belief.fill(1.0 / len(self.Belief))
+            self._LogBelief.fill(-log(len(self.Belief)))
+        self.LastActionIndex = actionIndex
+        
+        # Log some info
+        if logging:
+            self.Log["observation"].Append(theTime, fftData)
+            self.Log["confidence"].Append(theTime, self._Confidence)
+            self.Log["actionMade"].Append(theTime, actionIndex)
+        
+        latency = time.perf_counter() - startTime
+        self.Log["latency"].Append(theTime, latency)
+        if latencyBudget is not None and latency > latencyBudget:
+            self.Overruns += 1
+        if Profiling.IsEnabled():
+            Profiling.Record("ControlModel.Update", latency)
+        
+        return self.Actions[actionIndex]
+    
+    '''
+    Runs the control loop over an iterator of FFT windows, yielding one action label per window
+    
+    Arguments:
+        frames -> Iterator of FFT windows (see Update)
+        
+        latencyBudget -> See Update
+        
+        pauseGC -> Pause the garbage collector while streaming, since its pauses are the main source of jitter
+                   Update does not allocate, so nothing accumulates from the control loop itself
+                   The pause is process-wide though, so it also applies to every other thread until the stream ends
+    '''
+    def Stream(self, frames, latencyBudget=None, pauseGC=False):
+        assert self.Policy is not None
+        paused = pauseGC and gc.isenabled()
+        if paused:
+            gc.disable()
+        try:
+            for fftData in frames:
+                yield self.Update(fftData, latencyBudget)
+        finally:
+            if paused:
+                gc.enable()
+    
+    '''
+    Same as Stream, but consumes an asynchronous iterator (i.e. frames arriving from an asyncio reader)
+    '''
+    async def StreamAsync(self, frames, latencyBudget=None, pauseGC=False):
+        assert self.Policy is not None
+        paused = pauseGC and gc.isenabled()
+        if paused:
+            gc.disable()
+        try:
+            async for fftData in frames:
+                yield self.Update(fftData, latencyBudget)
+        finally:
+            if paused:
+                gc.enable()
+
+'''
+Builds the discrete observation model from the class Gaussians (see initControlModel33.m)
+    A grid of points is laid over the feature space and each point gets the posterior of every class
+    Points are grouped into strata by rounding their posteriors, and the strata are clustered
+    Each class's density is then numerically integrated within each cluster
+
+The grid is never built in full: points are generated and processed in chunks of "chunkPoints"
+
+Arguments:
+    means -> 2D matrix, one row per class
+
+    covariances -> 3D matrix, one covariance matrix per class
+
+    strataPerClass -> Number of levels each class posterior is rounded to
+
+    obsCardinality -> Number of observation labels (clusters of strata)
+
+    maxGridPoints -> Approximate number of grid points
+
+    maxCovarSteps -> The grid extends this many standard deviations past each mean
+
+Returns a 2D matrix where [Observation, Class] is the probability of the observation given the class
+'''
+def DiscretizeObservations(means, covariances, strataPerClass, obsCardinality, maxGridPoints, maxCovarSteps, chunkPoints):
+    means = asarray(means, dtype=float)
+    covariances = asarray(covariances, dtype=float)
+    classCount, dimensions = means.shape
+
+    # First calculate the numerical bounds of the grid
+    #   Expand a [hyper]rectangle around each of the means
+    #     The size of the [hyper]rectangle is based on the main covariance terms
+    #   Then wrap a bounding [hyper]square around all the [hyper]rectangles
+    deviations = maxCovarSteps * sqrt(diagonal(covariances, axis1=1, axis2=2))
+    lower = (means - deviations).min()
+    upper = (means + deviations).max()
+
+    gridResolution = int(maxGridPoints ** (1.0 / dimensions))
+    gridVals = linspace(lower, upper, gridResolution + 1)
+    gridShape = (len(gridVals),) * dimensions
+    pointCount = len(gridVals) ** dimensions
+
+    # This is the footprint of each column making up the Riemann sum
+    sampleVolume = (gridVals[1] - gridVals[0]) ** dimensions
+
+    inverseFactors, logNormalizers = _GaussianFactors(means, covariances)
+
+    # Strata are labeled by their rounded posteriors, packed into a single integer
+    strataRadix = strataPerClass ** arange(classCount, dtype=int64)
+    strataCodes = zeros(0, dtype=int64)
+    strataCounts = zeros(0)
+    strataCoordSums = zeros((0, dimensions))
+    strataIntegrals = zeros((0, classCount))
+
+    for start in range(0, pointCount, chunkPoints):
+        # Lazily build this chunk of the N-dimensional meshgrid
+        indices = unravel_index(arange(start, minimum(start + chunkPoints, pointCount)), gridShape)
+        coords = gridVals[column_stack(indices)]
+
+        # Batched Gaussian log-densities, one column per class
+        offsets = coords[newaxis, :, :] - means[:, newaxis, :]
+        whitened = einsum("kij,knj->kni", inverseFactors, offsets)
+        logDensities = (logNormalizers[:, newaxis] - 0.5 * (whitened ** 2).sum(axis=2)).T
+
+        # Posteriors (normalized in log space so that far away points do not underflow)
+        posteriors = exp(logDensities - logDensities.max(axis=1)[:, newaxis])
+        posteriors /= posteriors.sum(axis=1)[:, newaxis]
+        strata = floor((strataPerClass - 1) * posteriors + 0.5).astype(int64)
+        codes = strata @ strataRadix
+
+        # Sum up everything needed per stratum
+        chunkCodes, inverse = unique(codes, return_inverse=True)
+        chunkCounts = bincount(inverse, minlength=len(chunkCodes))
+        chunkCoordSums = column_stack([bincount(inverse, weights=coords[:, i], minlength=len(chunkCodes)) for i in range(dimensions)])
+        densities = exp(logDensities) * sampleVolume
+        chunkIntegrals = column_stack([bincount(inverse, weights=densities[:, i], minlength=len(chunkCodes)) for i in range(classCount)])
+
+        # Merge with the strata found in earlier chunks
+        strataCodes, inverse = unique(concatenate((strataCodes, chunkCodes)), return_inverse=True)
+        strataCounts = bincount(inverse, weights=concatenate((strataCounts, chunkCounts)), minlength=len(strataCodes))
+        strataCoordSums = _SumRows(inverse, vstack((strataCoordSums, chunkCoordSums)), len(strataCodes))
+        strataIntegrals = _SumRows(inverse, vstack((strataIntegrals, chunkIntegrals)), len(strataCodes))
+
+    # Cluster the strata to have fewer of them
+    strataMeans = strataCoordSums / strataCounts[:, newaxis]
+    clusters = _KMeans(strataMeans, int(minimum(obsCardinality, len(strataCodes))))
+    clusterIntegrals = _SumRows(clusters, strataIntegrals, clusters.max() + 1)
+
+    # Normalize out the observation model since we don't integrate out to infinity
+    return clusterIntegrals / clusterIntegrals.sum(axis=0)[newaxis, :]
+
+'''
+Precomputes the pieces of each class's Gaussian log-density
+    log N(x) = -0.5 * |inverse(L) * (x - mean)|^2 - log(det(L)) - 0.5 * d * log(2 pi)
+    where L is the Cholesky factor of the covariance
+Returns (inverse(L) for each class, the constant terms for each class)
+'''
+def _GaussianFactors(means, covariances):
+    factors = linalg.cholesky(covariances)
+    inverseFactors = linalg.inv(factors)
+    logNormalizers = -log(diagonal(factors, axis1=1, axis2=2)).sum(axis=1) - 0.5 * means.shape[1] * log(2 * pi)
+    return inverseFactors, logNormalizers
+
+'''
+Adds up the rows of "values" that share a label in "labels"
+'''
+def _SumRows(labels, values, count):
+    sums = zeros((count, values.shape[1]))
+    add.at(sums, labels, values)
+    return sums
+
+'''
+Lloyd's k-means with k-means++ seeding (deterministic for a given seed)
+Returns the cluster index of each point
+'''
+def _KMeans(points, k, iterations=100, seed=0):
+    rng = random.default_rng(seed)
+    centers = [points[rng.integers(len(points))]]
+    for i in range(1, k):
+        distances = ((points[:, newaxis, :] - array(centers)[newaxis, :, :]) ** 2).sum(axis=2).min(axis=1)
+        if distances.sum() == 0:
+            centers.append(points[rng.integers(len(points))])
+        else:
+            centers.append(points[rng.choice(len(points), p=distances / distances.sum())])
+    centers = array(centers)
+
+    labels = zeros(len(points), dtype=intp)
+    for iteration in range(iterations):
+        distances = ((points[:, newaxis, :] - centers[newaxis, :, :]) ** 2).sum(axis=2)
+        newLabels = argmin(distances, axis=1)
+        if iteration > 0 and all(newLabels == labels):
+            break
+        labels = newLabels
+        for i in range(k):
+            members = labels == i
+            if any(members):
+                centers[i] = points[members].mean(axis=0)
+
+    # Drop empty clusters so that the labels are contiguous
+    return unique(labels, return_inverse=True)[1]
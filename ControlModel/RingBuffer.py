@@ -0,0 +1,52 @@
+from numpy import *
+
+class RingBuffer:
+
+    '''
+    Fixed size log of timestamped values, the oldest entries are overwritten once it is full
+    All storage is allocated up front (or on the first append when the value shape is not known yet)
+        so appending never allocates, which keeps the control loop free of jitter
+
+    Arguments:
+        capacity -> Maximum number of entries kept
+
+        shape -> Shape of each value (None to take it from the first appended value)
+
+        dtype -> Type of each value
+    '''
+    def __init__(self, capacity, shape=None, dtype=float):
+        self._Capacity = capacity
+        self._DType = dtype
+        self._Count = 0
+        self._Times = zeros(capacity)
+        self._Values = None
+        if shape is not None:
+            self._Values = zeros((capacity,) + tuple(shape), dtype=dtype)
+
+    def __len__(self):
+        return int(minimum(self._Count, self._Capacity))
+
+    def Append(self, time, value):
+        if self._Values is None:
+            self._Values = zeros((self._Capacity,) + shape(value), dtype=self._DType)
+        position = self._Count % self._Capacity
+        self._Times[position] = time
+        self._Values[position] = value
+        self._Count += 1
+
+    '''
+    Returns the (time, value) of the most recent entry
+    '''
+    def Latest(self):
+        assert self._Count > 0
+        position = (self._Count - 1) % self._Capacity
+        return self._Times[position], self._Values[position]
+
+    '''
+    Returns copies of all the kept times and values, oldest first
+    '''
+    def Contents(self):
+        if self._Count == 0:
+            return zeros(0), zeros(0, dtype=self._DType)
+        order = (arange(len(self)) + maximum(0, self._Count - self._Capacity)) % self._Capacity
+        return self._Times[order], self._Values[order]
@@ -0,0 +1,74 @@
+from numpy import *
+
+class RunningGaussian:
+
+    '''
+    Streaming estimate of the mean and covariance of a stream of samples
+    Single samples are added with Welford's update, which costs O(d^2) and does not allocate
+    Batches and other estimators (i.e. from other chunks or worker processes) are combined with Chan's merge
+        so the samples never have to be held in memory at once
+
+    Arguments:
+        dimensions -> Length of each sample
+    '''
+    def __init__(self, dimensions):
+        self.Count = 0
+        self.Mean = zeros(dimensions)
+        self._Scatter = zeros((dimensions, dimensions)) # Sum of outer products of the deviations from the mean
+        self._Delta = zeros(dimensions)
+        self._NewDelta = zeros(dimensions)
+        self._Outer = zeros((dimensions, dimensions))
+
+    '''
+    Builds an estimator from an iterable of 2D chunks (one sample per row)
+    '''
+    @staticmethod
+    def FromChunks(chunks, dimensions):
+        estimator = RunningGaussian(dimensions)
+        for chunk in chunks:
+            estimator.UpdateBatch(chunk)
+        return estimator
+
+    '''
+    Adds a single sample
+    '''
+    def Update(self, sample):
+        self.Count += 1
+        subtract(sample, self.Mean, out=self._Delta)
+        self.Mean += self._Delta / self.Count
+        subtract(sample, self.Mean, out=self._NewDelta)
+        outer(self._Delta, self._NewDelta, out=self._Outer)
+        self._Scatter += self._Outer
+
+    '''
+    Adds a 2D batch of samples (one sample per row)
+    '''
+    def UpdateBatch(self, samples):
+        samples = asarray(samples, dtype=float64)
+        if samples.shape[0] == 0:
+            return
+        batch = RunningGaussian(samples.shape[1])
+        batch.Count = samples.shape[0]
+        batch.Mean = samples.mean(axis=0)
+        offsets = samples - batch.Mean
+        batch._Scatter = offsets.T @ offsets
+        self.Merge(batch)
+
+    '''
+    Adds all the samples seen by another estimator
+    '''
+    def Merge(self, other):
+        if other.Count == 0:
+            return
+        count = self.Count + other.Count
+        delta = other.Mean - self.Mean
+        self._Scatter += other._Scatter + outer(delta, delta) * (float(self.Count) * other.Count / count)
+        self.Mean += delta * (float(other.Count) / count)
+        self.Count = count
+
+    '''
+    Returns the sample covariance (normalized by N - 1, like cov)
+    '''
+    def Covariance(self):
+        assert self.Count > 1
+        return self._Scatter / (self.Count - 1)
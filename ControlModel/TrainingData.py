@@ -1,21 +1,194 @@
+import csv
 import json
+import struct
 from numpy import *
 
+# Time windows of each trial that initControlModel33.m trained on (TRAIN_WINDOWS = 1:23), see the "windows" arguments
+ORIGINAL_TRAIN_WINDOWS = range(0, 23)
+
+# Layout of the binary training data format
+#   8 bytes      -> MAGIC
+#   4 bytes      -> Length of the JSON header (little endian unsigned int)
+#   Header       -> JSON, {"Columns" : <# of training frequencies>, "Frequencies" : [<training frequency of each column>, ...],
+#                          "Blocks" : [[<frequency>, <first row>, <# of rows>], ...]}
+#                   Both the columns and the blocks are in increasing frequency
+#   Padding      -> Zeros up to the next multiple of ALIGNMENT bytes
+#   Data         -> Little endian float32 rows, all the rows of one training frequency are contiguous
+MAGIC = b"SSVEPFFT"
+ALIGNMENT = 64
+
 class DataWrapper:
-    def __init__(self, filename):
-        
-        if (filename.endswith('.json')):
-            raise NotImplementedError
-            
+
+    '''
+    Training data for the control model: FFT windows recorded while the user attended each frequency
+
+    Arguments:
+        filename -> Either a recording to parse into memory (".json" or ".csv", see Convert)
+                    or a file in the binary format (see Convert), which is memory-mapped instead of read
+
+        windows -> Time windows of each trial to keep from a JSON recording (see Convert)
+    '''
+    def __init__(self, filename, windows=None):
+
+        if (filename.endswith('.json') or filename.endswith('.csv')):
+            blocks = _ReadRecording(filename, windows)
+            self._Frequencies = sorted(blocks.keys())
+            self._Blocks = dict((frequency, blocks[frequency]) for frequency in self._Frequencies)
+
         else:
-            raise NotImplementedError
-    
+            assert windows is None, "The windows of a binary file are chosen when it is converted (see Convert)"
+            with open(filename, "rb") as f:
+                assert f.read(len(MAGIC)) == MAGIC
+                headerLength, = struct.unpack("<I", f.read(4))
+                header = json.loads(f.read(headerLength).decode())
+            dataStart = _Align(len(MAGIC) + 4 + headerLength)
+            totalRows = sum([rows for frequency, start, rows in header["Blocks"]])
+
+            # The columns are looked up by their position in GetFrequencies, so they have to be in the same order
+            assert "Frequencies" in header, "The column frequencies are missing, convert the recording again"
+            assert header["Frequencies"] == [frequency for frequency, start, rows in header["Blocks"]]
+
+            # The whole file is mapped once, every training frequency is a view into it
+            self._Data = memmap(filename, dtype="<f4", mode="r", offset=dataStart, shape=(totalRows, header["Columns"]))
+            self._Frequencies = [frequency for frequency, start, rows in header["Blocks"]]
+            self._Blocks = dict((frequency, self._Data[start:(start + rows)]) for frequency, start, rows in header["Blocks"])
+
     # Returns a 1D array of all training frequencies (ie. SSVEP LED flashing rate) within the data
     def GetFrequencies(self):
-        raise NotImplementedError
-        
+        return array(self._Frequencies)
+
     # Returns a 2D array of all FFT data of the given training frequency
     #   # of rows = (# of trials run) * (# of classes) * (# of time windows FFT'ed)
     #   # of columns = (# of training frequencies)
+    # For the binary format this is a read-only view of the file (nothing is copied)
     def GetFrequency(self, freq):
-        raise NotImplementedError
\ No newline at end of file
+        return self._Blocks[freq]
+
+    # Yields the FFT data of the given training frequency a few rows at a time
+    #   Only the rows of the current chunk are paged in from the file
+    def IterateFrequency(self, freq, chunkRows=65536):
+        block = self._Blocks[freq]
+        for start in range(0, block.shape[0], chunkRows):
+            yield block[start:(start + chunkRows)]
+
+'''
+Converts a recording into the binary format, one time, so that it can be memory-mapped afterwards
+
+Arguments:
+    source -> ".json" recording, a list with one entry per training frequency (see initControlModel33.m)
+                  [ { "condition" : "<frequency> Hz", "data" : <3D list indexed [FFT bucket][time window][trial]> }, ... ]
+                  where FFT bucket i is the 1Hz wide bucket for i Hz
+              or ".csv" recording with a header row and one row per time window
+                  frequency, <training frequency>, <training frequency>, ...
+                  <frequency attended>, <FFT value at that training frequency>, ...
+                  The training frequency columns may come in any order, they are sorted by their labels
+              CSV rows are streamed twice (count, then copy), so the recording never has to fit in memory
+
+    destination -> Path of the binary file to write
+
+    windows -> Indices of the time windows of each trial to keep (only for JSON recordings)
+               None keeps every window, unlike initControlModel33.m which kept the first 23 (see ORIGINAL_TRAIN_WINDOWS)
+'''
+def Convert(source, destination, windows=None):
+    if source.endswith('.json'):
+        blocks = _ReadRecording(source, windows)
+        counts = dict((frequency, block.shape[0]) for frequency, block in blocks.items())
+        data = _CreateFile(destination, counts)
+        for frequency, start, rows in _Layout(counts):
+            data[start:(start + rows)] = blocks[frequency]
+        data.flush()
+        return
+
+    # First pass counts the rows of each frequency
+    assert windows is None, "CSV recordings do not tell the time windows apart, so %s can only be used whole" % source
+    counts = {}
+    with open(source, "r") as f:
+        reader = csv.reader(f)
+        columnFrequencies, order = _ColumnOrder(next(reader))
+        for row in reader:
+            if row:
+                frequency = int(float(row[0]))
+                counts[frequency] = counts.get(frequency, 0) + 1
+    assert columnFrequencies == sorted(counts.keys()), "The columns of %s are not labelled with the attended frequencies" % source
+
+    # Second pass copies each row into its frequency's block (with the columns sorted)
+    data = _CreateFile(destination, counts)
+    nextRow = dict((frequency, start) for frequency, start, rows in _Layout(counts))
+    with open(source, "r") as f:
+        reader = csv.reader(f)
+        next(reader)
+        for row in reader:
+            if row:
+                frequency = int(float(row[0]))
+                data[nextRow[frequency]] = [float(row[column]) for column in order]
+                nextRow[frequency] += 1
+    data.flush()
+
+def _Align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+'''
+Returns (frequency, first row, # of rows) for each block, in increasing frequency
+'''
+def _Layout(counts):
+    layout = []
+    start = 0
+    for frequency in sorted(counts.keys()):
+        layout.append((frequency, start, counts[frequency]))
+        start += counts[frequency]
+    return layout
+
+'''
+Returns (training frequencies, column indices) of a CSV header row, both in increasing frequency
+'''
+def _ColumnOrder(header):
+    labels = [int(float(label)) for label in header[1:]]
+    order = argsort(labels, kind="mergesort").tolist()
+    return [labels[index] for index in order], [1 + index for index in order]
+
+'''
+Writes the header of a binary file and returns a writable memory map of its data
+    There is one column per training frequency, in the same (increasing) order as the blocks
+'''
+def _CreateFile(destination, counts):
+    layout = _Layout(counts)
+    columns = len(layout)
+    header = json.dumps({"Columns" : columns, "Frequencies" : [frequency for frequency, start, rows in layout], "Blocks" : layout}).encode()
+    dataStart = _Align(len(MAGIC) + 4 + len(header))
+    with open(destination, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        f.write(b"\0" * (dataStart - len(MAGIC) - 4 - len(header)))
+    totalRows = sum([rows for frequency, start, rows in layout])
+    return memmap(destination, dtype="<f4", mode="r+", offset=dataStart, shape=(totalRows, columns))
+
+'''
+Parses a JSON or CSV recording into {frequency : 2D float32 array} (see Convert)
+    The columns are the training frequencies in increasing order, whatever their order in the recording
+    Only the given time windows of a JSON recording are kept (None keeps them all)
+'''
+def _ReadRecording(filename, windows=None):
+    if filename.endswith('.json'):
+        with open(filename, "r") as f:
+            trainingData = json.load(f)
+        conditions = [int(float(trial["condition"].split()[0])) for trial in trainingData]
+        columnFrequencies = sorted(conditions)
+
+        # Keep the FFT buckets of the training frequencies and lay the (window, trial) pairs out as rows
+        #   Rows are ordered trial by trial, like masterData in initControlModel33.m
+        blocks = {}
+        for condition, trial in zip(conditions, trainingData):
+            data = asarray(trial["data"], dtype=float32)[columnFrequencies, :, :]
+            if windows is not None:
+                data = data[:, list(windows), :]
+            blocks[condition] = ascontiguousarray(transpose(data, (2, 1, 0)).reshape(-1, len(conditions)))
+        return blocks
+
+    assert windows is None, "CSV recordings do not tell the time windows apart, so %s can only be used whole" % filename
+    with open(filename, "r") as f:
+        columnFrequencies, order = _ColumnOrder(next(csv.reader(f)))
+    values = loadtxt(filename, delimiter=",", skiprows=1, dtype=float64, ndmin=2)
+    frequencies = values[:, 0].astype(int)
+    assert columnFrequencies == unique(frequencies).tolist(), "The columns of %s are not labelled with the attended frequencies" % filename
+    return dict((frequency, ascontiguousarray(values[frequencies == frequency][:, order], dtype=float32)) for frequency in columnFrequencies)
@@ -1,6 +1,10 @@
 import json
 from numpy import *
 import numpy.testing
+from SparseTransition import DeterministicTransition
+from PomdpWriter import WritePOMDP
+from Solver import PointBasedSolver, FactoredSolver, DEFAULT_PRECISION
+import Profiling
 
 class DialogPOMDP:
     
@@ -42,93 +46,18 @@ class DialogPOMDP:
                        Rank of matrix should equal to the length of the "Observations" key in the JSON file (above)
                        Each column of the matrix should add to one
                            ie. The total probability of observing A in all states is 100%
+        
+        rewards -> Optional dictionary that overrides entries of "Rewards" in the JSON file
     '''
-    def __init__(self, filename, observeProb):
-        filehandle = open(filename, "r")
-        self._Model = json.load(filehandle)
+    @Profiling.Timed("DialogPOMDP.Build")
+    def __init__(self, filename, observeProb, rewards=None):
+        self._Model, self._Questions, self.QuestionEffects = _ReadModel(filename, observeProb, rewards)
         self._States = []
         self._Actions = []
         self._InitialBelief = [] 
-        self._TransitionMatrix = {}  # [Action][Start, End]
+        self._TransitionMatrix = {}  # [Action][Start, End] (sparse, see SparseTransition.py)
         self._ObservationMatrix = [] # [State, Observation]
         self._RewardMatrix = []      # [Action, State]
-        
-        #######################################################################
-        ##                      Top Level JSON Checking                      ##
-        #######################################################################
-        assert self._Model.has_key("Classifications")
-        assert self._Model.has_key("Observations")
-        assert self._Model.has_key("Questions")
-        assert self._Model.has_key("Rewards")
-        assert self._Model["Rewards"].has_key("Success")
-        assert self._Model["Rewards"].has_key("Failure")
-        assert self._Model["Rewards"].has_key("Question")
-        assert self._Model["Rewards"]["Question"] > self._Model["Rewards"]["Failure"]
-        assert self._Model["Rewards"].has_key("Wait")
-        assert self._Model.has_key("Time Discount")
-        
-        # No whitespace is allowed in the labels
-        for category in self._Model["Classifications"]:
-            assert len(category.split()) == 1
-        for observation in self._Model["Observations"]:
-            assert len(observation.split()) == 1
-        for question in self._Model["Questions"].keys():
-            assert len(question.split()) == 1
-        
-        # Check the observation probabilities matrix
-        assert len(observeProb.shape) == 2
-        assert observeProb.shape[0] == observeProb.shape[1]
-        assert len(self._Model["Observations"]) == observeProb.shape[0]
-        numpy.testing.assert_almost_equal(sum(observeProb, axis=0), ones(observeProb.shape[0]))  
-        
-        # Check the time discount bounds
-        assert self._Model["Time Discount"] >= 0 and self._Model["Time Discount"] <= 1
-        
-        #######################################################################
-        ##            JSON Model Content Checking & Preprocessing            ##
-        #######################################################################
-        # Use the observation matrix "observeProb" to construct 
-        #     a 2D observation probability matrix for each question
-        #     To access the matrix -> self._Model["Questions"][Question]["Effect"]
-        #     To determine the value of some cell -> matrix[Classification][Observation]
-        # Also check the structure of the questions the POMDP can ask 
-        for question in self._Model["Questions"].keys():
-        
-            # This does not have any effect on the POMDP, but should be included as a context item
-            assert "English" in self._Model["Questions"][question]
-            assert "Effect" in self._Model["Questions"][question]
-            
-            # Initialize the observation probability matrix such that each observation is equally likely
-            questionObserveProb = ones((len(self._Model["Classifications"]), len(self._Model["Observations"])))
-            questionObserveProb /= len(self._Model["Observations"])
-            
-            # For each specified classification, calculate an observation vector
-            #    such that the n-th value represents P(noisy observation | classification)
-            for category in self._Model["Questions"][question]["Effect"].keys():
-            
-                # Make sure all the states affected by the classification exist in the model
-                assert category in self._Model["Classifications"]
-                categoryInd = self._Model["Classifications"].index(category)
-                
-                # First fill in the observation vector with P(classification | noiseless observation)
-                transProb = zeros(len(self._Model["Observations"]));
-                for observation in self._Model["Questions"][question]["Effect"][category].keys():
-                
-                    # Make sure all the observations used by the question exist in the model
-                    assert observation in self._Model["Observations"]
-                    observeInd = self._Model["Observations"].index(observation)
-                    
-                    transProb[observeInd] = self._Model["Questions"][question]["Effect"][category][observation]
-                    
-                # Now multiply the observation vector by the observation matrix and normalize
-                #   ie. Apply Bayes' rule
-                # Place the observation vector into the observation probability matrix
-                transProb = dot(transProb, observeProb)
-                transProb /= sum(transProb)
-                questionObserveProb[categoryInd, :] = transProb
-            
-            # Save the observation probability matrix in place of the data used to generate it
-            self._Model["Questions"][question]["Effect"] = questionObserveProb
             
         #######################################################################
         ##                           POMDP States                            ##
@@ -182,37 +111,32 @@ class DialogPOMDP:
         ##            POMDP Action Transition Probability Matrix             ##
         #######################################################################
         # All actions result in deterministic transitions (probability 0 or 1)
-        # The transition matrix is a map of 2D matrices
-        #     Representation -> self._TransitionMatrix[Action][Start State][End State]
+        # The transition matrix is a map of sparse 2D matrices
+        #     Representation -> self._TransitionMatrix[Action][Start State, End State]
+        # Each action only moves the states of one or two blocks (general, question, terminal)
+        #     All other states transition to themselves, so only the moving blocks are stored
         GeneralBeliefEndIndex = len(self._Model["Classifications"])
-        QuestionBeliefEndIndex = (1 + len(self._Questions)) * self._GeneralBeliefEndIndex
+        QuestionBeliefEndIndex = (1 + len(self._Questions)) * GeneralBeliefEndIndex
+        NumStates = len(self._States)
         
         # Control action "wait" - all states transition to themselves
-        self._TransitionMatrix["wait"] = eye(len(self._States))
+        self._TransitionMatrix["wait"] = DeterministicTransition(NumStates)
                 
         # Control action "finish" - all question belief states transfer to the corresponding general belief state
-        self._TransitionMatrix["finish"] = zeros((len(self._States), len(self._States)))
-        self._TransitionMatrix["finish"][0:GeneralBeliefEndIndex, 0:GeneralBeliefEndIndex] = eye(GeneralBeliefEndIndex)
-        self._TransitionMatrix["finish"][QuestionBeliefEndIndex:len(self._States), QuestionBeliefEndIndex:len(self._States)] = eye(len(self._States) - GeneralBeliefEndIndex)
-        
-        for questionIndex in range(len(self._Questions)):
-            questionStateStartIndex = (1 + questionIndex) * len(self._Model["Classifications"])
-            self._TransitionMatrix["finish"][questionStateStartIndex:(questionStateStartIndex + len(self._Model["Classifications"])), 0:GeneralBeliefEndIndex] = eye(GeneralBeliefEndIndex)
+        finishSources = arange(GeneralBeliefEndIndex, QuestionBeliefEndIndex)
+        finishTargets = finishSources % GeneralBeliefEndIndex
+        self._TransitionMatrix["finish"] = DeterministicTransition(NumStates, finishSources, finishTargets)
         
         # Asking a question will transfer all belief from general to question belief
         for questionIndex in range(len(self._Questions)):
             questionLabel = "qA_" + self._Questions[questionIndex]
-            self._TransitionMatrix[questionLabel] = eye(len(self._States))
-            self._TransitionMatrix[questionLabel][0:GeneralBeliefEndIndex, 0:GeneralBeliefEndIndex] = zeros((GeneralBeliefEndIndex, GeneralBeliefEndIndex))
-            questionStateStartIndex = (1 + questionIndex) * len(self._Model["Classifications"])
-            self._TransitionMatrix[questionLabel][0:GeneralBeliefEndIndex, questionStateStartIndex:(questionStateStartIndex + len(self._Model["Classifications"]))] = eye(GeneralBeliefEndIndex)
+            questionStateStartIndex = (1 + questionIndex) * GeneralBeliefEndIndex
+            self._TransitionMatrix[questionLabel] = DeterministicTransition.Block(NumStates, 0, questionStateStartIndex, GeneralBeliefEndIndex)
             
         # Classifying will transfer all general belief into a single terminal state
         for actionIndex in range(len(self._Model["Classifications"])):
             actionLabel = "cA_" + self._Model["Classifications"][actionIndex]
-            self._TransitionMatrix[actionLabel] = eye(len(self._States))
-            self._TransitionMatrix[actionLabel][0:GeneralBeliefEndIndex, 0:GeneralBeliefEndIndex] = zeros((GeneralBeliefEndIndex, GeneralBeliefEndIndex))
-            self._TransitionMatrix[actionLabel][0:GeneralBeliefEndIndex, QuestionBeliefEndIndex + actionIndex] = ones(GeneralBeliefEndIndex)
+            self._TransitionMatrix[actionLabel] = DeterministicTransition(NumStates, arange(GeneralBeliefEndIndex), repeat(QuestionBeliefEndIndex + actionIndex, GeneralBeliefEndIndex))
                 
         #######################################################################
         ##               POMDP Observation Probability Matrix                ##
@@ -224,12 +148,8 @@ class DialogPOMDP:
         self._ObservationMatrix[0:GeneralBeliefEndIndex, 0:NumObservations] = ones((GeneralBeliefEndIndex, NumObservations)) / float(NumObservations)
         self._ObservationMatrix[QuestionBeliefEndIndex:len(self._States), 0:NumObservations] = ones((GeneralBeliefEndIndex, NumObservations)) / float(NumObservations)
         
-        for questionIndex in range(len(self._Questions)):
-            question = self._Questions[questionIndex]
-            categoryIndex = questionIndex * (1 + len(self._Model["Classifications"]))
-            
-            # Fill in the matrix with the piece-wise observation matrix
-            self._ObservationMatrix[categoryIndex:(categoryIndex + len(self._Model["Classifications"])), NumObservations] = self._Model["Questions"][question]["Effect"]
+        # Fill in the question blocks with the piece-wise observation matrices
+        self._ObservationMatrix[GeneralBeliefEndIndex:QuestionBeliefEndIndex, 0:NumObservations] = self.QuestionEffects.reshape(-1, NumObservations)
         
         #######################################################################
         ##                        POMDP Reward Matrix                        ##
@@ -248,75 +168,412 @@ class DialogPOMDP:
             self._RewardMatrix[self._Actions.index("qA_" + question), 0:len(self._States)] = ones((1, len(self._States))) * self._Model["Rewards"]["Question"]
         
         # Correct classification reward
-        for action in self._Model["Classifications"]:
+        for categoryIndex, action in enumerate(self._Model["Classifications"]):
             actionIndex = self._Actions.index("cA_" + action)
-            self._RewardMatrix[actionIndex, actionIndex] = self._Model["Rewards"]["Success"]
+            self._RewardMatrix[actionIndex, categoryIndex] = self._Model["Rewards"]["Success"]
             
             # Reclassifying from terminal states is meaningless
             self._RewardMatrix[actionIndex, QuestionBeliefEndIndex:len(self._States)] = zeros((1, GeneralBeliefEndIndex))
         
     '''
     Writes a POMDP input file that can be solved with some POMDP solvers (i.e. APPL)
+    
+    Arguments:
+        filename -> Path of the output file, or an open text file object (i.e. a pipe into the solver)
+                    Paths ending in ".gz" are gzip compressed and "-" writes to standard output
     '''
+    @Profiling.Timed("DialogPOMDP.GenerateFile")
     def GenerateFile(self, filename):
-        f = open(filename, "w")
-
-        # Give a time discounting factor (to prevent the POMDP from gathering info infinitely)
-        f.write("discount: " + str(self._Model["Time Discount"]) + "\n")
-        
-        # Use a reward function for maximization (as opposed to a cost function for minimization)
-        f.write("values: reward\n")
-        
-        #################################################################
-        ##                           Labels                            ##
-        #################################################################
-        f.write("states:")
-        for state in self._States:
-            f.write(" " + state)
-        f.write("\n")
-        
-        f.write("actions:")
-        for action in self._Actions:
-            f.write(" " + action)
-        f.write("\n")
+        WritePOMDP(filename, 
+                   self._Model["Time Discount"], 
+                   self._States, 
+                   self._Actions, 
+                   ["o_" + observation for observation in self._Model["Observations"]], 
+                   self._InitialBelief, 
+                   [self._TransitionMatrix[action] for action in self._Actions], 
+                   self._ObservationMatrix, 
+                   self._RewardMatrix)
+    
+    '''
+    Solves the POMDP in-process with point-based value iteration (see Solver.py)
+    Returns (planes, actions), where planes has one alpha vector per column and actions indexes self._Actions
+    
+    Arguments:
+        precision -> Stop once further iterations could add at most this much value at the belief points (see Solver.py)
+        
+        timeout -> Stop after this many seconds (None means no limit)
+        
+        maxIterations -> Stop after this many iterations (None means no limit)
+        
+        solverArgs -> Extra arguments for PointBasedSolver (i.e. beliefCount, seed)
+    '''
+    @Profiling.Timed("DialogPOMDP.Solve")
+    def Solve(self, precision=DEFAULT_PRECISION, timeout=None, maxIterations=None, **solverArgs):
+        solver = PointBasedSolver([self._TransitionMatrix[action] for action in self._Actions], 
+                                  self._ObservationMatrix, 
+                                  self._RewardMatrix, 
+                                  self._Model["Time Discount"], 
+                                  asarray(self._InitialBelief, dtype=float), 
+                                  **solverArgs)
+        return solver.Solve(precision=precision, timeout=timeout, maxIterations=maxIterations)
+    
+    '''
+    Saves the compiled model (all the POMDP matrices) into a NumPy ".npz" file
+    '''
+    def Save(self, filename):
+        # The question effects are stored separately as one tensor
+        model = dict(self._Model)
+        model["Questions"] = dict((question, dict(self._Model["Questions"][question], Effect=None)) for question in self._Questions)
+        
+        moves = [self._TransitionMatrix[action].Moves() for action in self._Actions]
+        savez(filename, 
+              Model=json.dumps(model), 
+              States=array(self._States), 
+              Actions=array(self._Actions), 
+              Questions=array(self._Questions), 
+              QuestionEffects=self.QuestionEffects, 
+              InitialBelief=asarray(self._InitialBelief, dtype=float), 
+              TransitionCounts=array([len(sources) for sources, targets in moves]), 
+              TransitionSources=concatenate([sources for sources, targets in moves]), 
+              TransitionTargets=concatenate([targets for sources, targets in moves]), 
+              ObservationMatrix=self._ObservationMatrix, 
+              RewardMatrix=self._RewardMatrix)
+    
+    '''
+    Loads a model saved with Save, without re-parsing or recompiling anything
+    '''
+    @staticmethod
+    def Load(filename):
+        data = load(filename)
+        dialog = DialogPOMDP.__new__(DialogPOMDP)
+        dialog._Model = json.loads(str(data["Model"]))
+        dialog._States = data["States"].tolist()
+        dialog._Actions = data["Actions"].tolist()
+        dialog._Questions = data["Questions"].tolist()
+        dialog._InitialBelief = [str(belief) for belief in data["InitialBelief"]]
+        dialog._ObservationMatrix = data["ObservationMatrix"]
+        dialog._RewardMatrix = data["RewardMatrix"]
+        
+        dialog.QuestionEffects = data["QuestionEffects"]
+        for questionIndex, question in enumerate(dialog._Questions):
+            dialog._Model["Questions"][question]["Effect"] = dialog.QuestionEffects[questionIndex]
+        
+        dialog._TransitionMatrix = {}
+        offsets = concatenate(([0], cumsum(data["TransitionCounts"])))
+        sources = data["TransitionSources"]
+        targets = data["TransitionTargets"]
+        for actionIndex, action in enumerate(dialog._Actions):
+            dialog._TransitionMatrix[action] = DeterministicTransition(len(dialog._States), 
+                                                                       sources[offsets[actionIndex]:offsets[actionIndex + 1]], 
+                                                                       targets[offsets[actionIndex]:offsets[actionIndex + 1]])
+        return dialog
 
-        f.write("observations:")
-        for observation in self._Model["Observations"]:
-            f.write(" o_" + observation)
-        f.write("\n")
+class FactoredDialogPOMDP:
+    
+    '''
+    The same dialog system as DialogPOMDP, without flattening the question states
+    The state is split into two factors
+        Mode  -> What the dialog is doing, which is always known (every action moves it deterministically)
+                     0                                    -> General, not asking a question
+                     1 + <question index>                 -> Asking that question
+                     1 + <# of questions> + <class index> -> Terminal, after classifying as that class
+        Class -> The classification, which never changes and is only seen through the question observations
+    A belief is therefore a mode plus a belief over the classes
+    The observations of every question come from the shared tensor self.QuestionEffects[Question, Classification, Observation]
+        So memory and solve time grow with (# of classes + # of questions) instead of their product
+    The file for external solvers is only flattened when it is written (see GenerateFile)
+    
+    Arguments:
+        Same as DialogPOMDP
+    '''
+    
+    # Kinds of actions, see self._ActionKinds
+    WAIT_ACTION = 0
+    FINISH_ACTION = 1
+    ASK_ACTION = 2
+    CLASSIFY_ACTION = 3
+    
+    GENERAL_MODE = 0
+    
+    @Profiling.Timed("FactoredDialogPOMDP.Build")
+    def __init__(self, filename, observeProb, rewards=None):
+        self._Model, self._Questions, self.QuestionEffects = _ReadModel(filename, observeProb, rewards)
+        self._CumulativeEffects = cumsum(self.QuestionEffects, axis=2)
+        
+        self.NumClasses = len(self._Model["Classifications"])
+        self.NumObservations = len(self._Model["Observations"])
+        self.NumModes = 1 + len(self._Questions) + self.NumClasses
+        self.Discount = float(self._Model["Time Discount"])
+        self._TerminalStart = 1 + len(self._Questions)
+        
+        # The model starts out in the general mode, uniform across the classes
+        self.InitialMode = self.GENERAL_MODE
+        self.InitialBelief = ones(self.NumClasses) / self.NumClasses
+        
+        # Same actions (and order) as DialogPOMDP
+        #     Each action is a kind and a target (the question asked or the class chosen)
+        self._Actions = ["wait", "finish"] + ["qA_" + question for question in self._Questions] + ["cA_" + category for category in self._Model["Classifications"]]
+        self._ActionKinds = concatenate(([self.WAIT_ACTION, self.FINISH_ACTION], 
+                                         full(len(self._Questions), self.ASK_ACTION), 
+                                         full(self.NumClasses, self.CLASSIFY_ACTION)))
+        self._ActionTargets = concatenate(([0, 0], arange(len(self._Questions)), arange(self.NumClasses)))
+        self.NumActions = len(self._Actions)
+        
+        # Reward of each kind of action, before the classification rewards are applied
+        self._KindRewards = array([self._Model["Rewards"]["Wait"], 0, self._Model["Rewards"]["Question"], self._Model["Rewards"]["Failure"]], dtype=float)
+    
+    '''
+    Returns the mode reached by taking each action in each mode (arguments are broadcast together)
+        "finish" moves from a question back to the general mode
+        Asking and classifying move from the general mode into a question or terminal mode
+        Everything else keeps the mode
+    '''
+    def NextModes(self, modes, actions):
+        modes, actions = broadcast_arrays(asarray(modes, dtype=intp), asarray(actions, dtype=intp))
+        kinds = self._ActionKinds[actions]
+        targets = self._ActionTargets[actions]
+        general = modes == self.GENERAL_MODE
+        question = (modes > self.GENERAL_MODE) & (modes < self._TerminalStart)
+        
+        nextModes = where((kinds == self.FINISH_ACTION) & question, self.GENERAL_MODE, modes)
+        nextModes = where((kinds == self.ASK_ACTION) & general, 1 + targets, nextModes)
+        return where((kinds == self.CLASSIFY_ACTION) & general, self._TerminalStart + targets, nextModes)
+    
+    '''
+    Returns the reward for taking each action in each mode and class (arguments are broadcast together)
+    '''
+    def Rewards(self, modes, actions, classes):
+        modes, actions, classes = broadcast_arrays(asarray(modes, dtype=intp), asarray(actions, dtype=intp), asarray(classes, dtype=intp))
+        kinds = self._ActionKinds[actions]
+        classify = kinds == self.CLASSIFY_ACTION
+        rewards = self._KindRewards[kinds]
+        
+        # Classifying is only rewarded from the general mode, and is meaningless once terminal
+        rewards = where(classify & (modes == self.GENERAL_MODE) & (classes == self._ActionTargets[actions]), self._Model["Rewards"]["Success"], rewards)
+        return where(classify & (modes >= self._TerminalStart), 0.0, rewards)
+    
+    '''
+    Returns the rewards of every action in one mode, '[Action, Class]'
+    '''
+    def ModeRewards(self, mode):
+        return self.Rewards(mode, arange(self.NumActions)[:, newaxis], arange(self.NumClasses)[newaxis, :])
+    
+    '''
+    Returns the worst reward of each action over every mode and class
+    '''
+    def WorstRewards(self):
+        # Rewards only depend on the kind of mode, so one mode of each kind covers them all
+        modes = unique([self.GENERAL_MODE, int(minimum(1, self._TerminalStart - 1)), self._TerminalStart])
+        return self.Rewards(modes[:, newaxis, newaxis], arange(self.NumActions)[newaxis, :, newaxis], arange(self.NumClasses)[newaxis, newaxis, :]).min(axis=(0, 2))
+    
+    '''
+    Returns the observation probabilities on arriving in a mode, '[Class, Observation]'
+        or None when the observations carry no information (they are uniform)
+    '''
+    def ModeObservations(self, mode):
+        if mode > self.GENERAL_MODE and mode < self._TerminalStart:
+            return self.QuestionEffects[mode - 1]
+        return None
+    
+    '''
+    Draws one observation for each episode, given the mode it arrived in and its true class
+    '''
+    def SampleObservations(self, rng, modes, classes):
+        draws = rng.random(len(modes))
+        observations = minimum((draws * self.NumObservations).astype(intp), self.NumObservations - 1)
+        asking = flatnonzero((modes > self.GENERAL_MODE) & (modes < self._TerminalStart))
+        cumulative = self._CumulativeEffects[modes[asking] - 1, classes[asking]]
+        observations[asking] = minimum(sum(cumulative < draws[asking, newaxis], axis=1), self.NumObservations - 1)
+        return observations
+    
+    '''
+    Conditions each class belief (one per row) on its observation, given the mode it arrived in
+        Only question modes carry information, the other beliefs are returned unchanged
+    '''
+    def UpdateBeliefs(self, modes, beliefs, observations):
+        beliefs = array(beliefs, dtype=float)
+        asking = flatnonzero((modes > self.GENERAL_MODE) & (modes < self._TerminalStart))
+        conditioned = beliefs[asking] * self.QuestionEffects[modes[asking] - 1, :, observations[asking]]
+        totals = sum(conditioned, axis=1)
+        beliefs[asking] = where(totals[:, newaxis] > 0, conditioned / maximum(totals, 1e-300)[:, newaxis], beliefs[asking])
+        return beliefs
+    
+    '''
+    Converts factored beliefs into beliefs over the states of the flattened model (see DialogPOMDP)
+    '''
+    def FlatBeliefs(self, modes, beliefs):
+        modes = asarray(modes, dtype=intp)
+        beliefs = atleast_2d(beliefs)
+        flat = zeros((beliefs.shape[0], (self._TerminalStart + 1) * self.NumClasses))
+        for mode in unique(modes).tolist():
+            rows = flatnonzero(modes == mode)
+            if mode < self._TerminalStart:
+                flat[rows, (mode * self.NumClasses):((mode + 1) * self.NumClasses)] = beliefs[rows]
+            else:
+                flat[rows, self._TerminalStart * self.NumClasses + mode - self._TerminalStart] = 1
+        return flat
+    
+    '''
+    Solves the POMDP in the factored form (see FactoredSolver in Solver.py)
+    Returns (planes, actions, modes), where planes has one alpha vector over the classes per column
+        'modes' holds the mode each plane applies to, and actions index the same labels as DialogPOMDP
+    
+    Arguments:
+        Same as DialogPOMDP.Solve
+    '''
+    @Profiling.Timed("FactoredDialogPOMDP.Solve")
+    def Solve(self, precision=DEFAULT_PRECISION, timeout=None, maxIterations=None, **solverArgs):
+        solver = FactoredSolver(self, **solverArgs)
+        return solver.Solve(precision=precision, timeout=timeout, maxIterations=maxIterations)
+    
+    '''
+    Writes the same POMDP input file as DialogPOMDP.GenerateFile, for solvers that need the flat form
+    The flattened rows are generated while the file is written, so the flat matrices are never held in memory
+    '''
+    @Profiling.Timed("FactoredDialogPOMDP.GenerateFile")
+    def GenerateFile(self, filename):
+        classCount = self.NumClasses
+        numStates = (self._TerminalStart + 1) * classCount
+        
+        # Mode and class of each flattened state (terminal states keep the chosen class, not the true one)
+        stateModes = concatenate((repeat(arange(self._TerminalStart), classCount), arange(self._TerminalStart, self.NumModes)))
+        stateClasses = concatenate((tile(arange(classCount), self._TerminalStart), zeros(classCount, dtype=intp)))
+        states = ["S_" + category for category in self._Model["Classifications"]]
+        for question in self._Questions:
+            states.extend(["q_" + question + "_S_" + category for category in self._Model["Classifications"]])
+        states.extend(["tS_" + category for category in self._Model["Classifications"]])
+        
+        # Only the modes that an action moves out of have moving states
+        transitions = []
+        for action in range(self.NumActions):
+            nextModes = self.NextModes(arange(self.NumModes), action)
+            sources = flatnonzero(nextModes[stateModes] != stateModes)
+            transitions.append(DeterministicTransition(numStates, sources, self._FlatStates(nextModes[stateModes[sources]], stateClasses[sources])))
+        
+        initialBelief = zeros(numStates)
+        initialBelief[0:classCount] = self.InitialBelief
+        
+        WritePOMDP(filename, 
+                   self._Model["Time Discount"], 
+                   states, 
+                   self._Actions, 
+                   ["o_" + observation for observation in self._Model["Observations"]], 
+                   initialBelief, 
+                   transitions, 
+                   self._FlatObservationRows(), 
+                   (self.Rewards(stateModes, action, stateClasses) for action in range(self.NumActions)))
+    
+    '''
+    Returns the index of each (mode, class) in the flattened states
+    '''
+    def _FlatStates(self, modes, classes):
+        return where(modes < self._TerminalStart, modes * self.NumClasses + classes, self._TerminalStart * self.NumClasses + modes - self._TerminalStart)
+    
+    '''
+    Yields the rows of the flattened observation matrix, '[State, Observation]'
+    '''
+    def _FlatObservationRows(self):
+        uniform = ones(self.NumObservations) / float(self.NumObservations)
+        for category in range(self.NumClasses):
+            yield uniform
+        for effects in self.QuestionEffects:
+            for row in effects:
+                yield row
+        for category in range(self.NumClasses):
+            yield uniform
 
-        #################################################################
-        ##                       Initial Belief                        ##
-        #################################################################
-        f.write("start:")
-        for belief in self._InitialBelief:
-            f.write(" " + belief)
-        f.write("\n")
-        
-        #################################################################
-        ##                      Transition matrix                      ##
-        #################################################################
-        for action in self._Actions:
-            for priorStateIndex in range(len(self._States)):
-                for postStateIndex in range(len(self._States)):
-                    probability = self._TransitionMatrix[action][priorStateIndex, postStateIndex]
-                    if (probability != 0): # Omit all the zeros
-                        f.write("T : " + action + " : " + self._States[priorStateIndex] + " : " + self._States[postStateIndex] + " " + str(probability) + "\n")
-        
-        #################################################################
-        ##               Observation Probability Matrix                ##
-        #################################################################
-        for stateIndex in range(len(self._States)):
-            for observationIndex in range(len(self._Model["Observations"])):
-                probability = self._ObservationMatrix[stateIndex, observationIndex]
-                if (probability != 0): # Omit all the zeros
-                    f.write("O : * : " + self._States[stateIndex] + " : o_" + self._Model["Observations"][observationIndex] + " " + str(probability)
+'''
+Reads and checks a dialog JSON file, then applies the observation matrix to every question (see DialogPOMDP)
+Returns (model, questions, questionEffects)
+    model -> The parsed JSON, with each question's "Effect" replaced by its observation matrix
+    questions -> The question labels, in the order used for states and actions
+    questionEffects -> 3D tensor, 'questionEffects[Question, Classification, Observation]'
+'''
+def _ReadModel(filename, observeProb, rewards=None):
+    with open(filename, "r") as filehandle:
+        model = json.load(filehandle)
+    if rewards is not None:
+        model["Rewards"].update(rewards)
 
-        #################################################################
-        ##                        Reward Matrix                        ##
-        #################################################################
-        for actionIndex in range(len(self._Actions)):
-            for stateIndex in range(len(self._States)):
-                reward = self._RewardMatrix[actionIndex, stateIndex]
-                if (reward != 0): # Omit all the zeros
-                    f.write("R : " self._Actions[actionIndex] + " : " + self._States[stateIndex] + " : * : * " + str(reward) + "\n")
+    #######################################################################
+    ##                      Top Level JSON Checking                      ##
+    #######################################################################
+    assert "Classifications" in model
+    assert "Observations" in model
+    assert "Questions" in model
+    assert "Rewards" in model
+    assert "Success" in model["Rewards"]
+    assert "Failure" in model["Rewards"]
+    assert "Question" in model["Rewards"]
+    assert model["Rewards"]["Question"] > model["Rewards"]["Failure"]
+    assert "Wait" in model["Rewards"]
+    assert "Time Discount" in model
+    
+    # No whitespace is allowed in the labels
+    for category in model["Classifications"]:
+        assert len(category.split()) == 1
+    for observation in model["Observations"]:
+        assert len(observation.split()) == 1
+    for question in model["Questions"].keys():
+        assert len(question.split()) == 1
+    
+    # Check the observation probabilities matrix
+    assert len(observeProb.shape) == 2
+    assert observeProb.shape[0] == observeProb.shape[1]
+    assert len(model["Observations"]) == observeProb.shape[0]
+    numpy.testing.assert_almost_equal(sum(observeProb, axis=0), ones(observeProb.shape[0]))  
+    
+    # Check the time discount bounds
+    assert model["Time Discount"] >= 0 and model["Time Discount"] <= 1
+    
+    #######################################################################
+    ##            JSON Model Content Checking & Preprocessing            ##
+    #######################################################################
+    # Fix the order of the questions so that states and actions line up
+    questions = list(model["Questions"].keys())
+    
+    # Use the observation matrix "observeProb" to construct 
+    #     a 2D observation probability matrix for each question
+    #     All the matrices are stacked into one tensor -> questionEffects[Question, Classification, Observation]
+    #     To access one matrix -> model["Questions"][Question]["Effect"] (a view into the tensor)
+    # Also check the structure of the questions the POMDP can ask 
+    categoryIndices = dict((category, index) for index, category in enumerate(model["Classifications"]))
+    observationIndices = dict((observation, index) for index, observation in enumerate(model["Observations"]))
+    
+    # First gather P(classification | noiseless observation) for every question into one tensor
+    #     Rows of classifications that a question does not specify are marked, they stay uniform
+    transProb = zeros((len(questions), len(categoryIndices), len(observationIndices)))
+    specified = zeros((len(questions), len(categoryIndices)), dtype=bool)
+    for questionIndex, question in enumerate(questions):
+    
+        # This does not have any effect on the POMDP, but should be included as a context item
+        assert "English" in model["Questions"][question]
+        assert "Effect" in model["Questions"][question]
+        
+        for category, effect in model["Questions"][question]["Effect"].items():
+        
+            # Make sure all the states affected by the classification exist in the model
+            assert category in categoryIndices
+            categoryInd = categoryIndices[category]
+            specified[questionIndex, categoryInd] = True
+            
+            for observation, probability in effect.items():
+            
+                # Make sure all the observations used by the question exist in the model
+                assert observation in observationIndices
+                transProb[questionIndex, categoryInd, observationIndices[observation]] = probability
+    
+    # Now multiply every observation vector by the observation matrix at once and normalize
+    #   ie. Apply Bayes' rule
+    questionEffects = matmul(transProb, observeProb)
+    totals = sum(questionEffects, axis=2)
+    totals[~specified] = 1
+    questionEffects /= totals[:, :, newaxis]
+    
+    # Observations are equally likely for the classifications a question does not mention
+    questionEffects[~specified] = 1.0 / len(observationIndices)
+    
+    # Save the observation probability matrix in place of the data used to generate it
+    for questionIndex, question in enumerate(questions):
+        model["Questions"][question]["Effect"] = questionEffects[questionIndex]
+    return model, questions, questionEffects
@@ -11,4 +11,8 @@ dialogGenerator.GenerateFile("Examples/Test.pomdp")
 
 # Call the POMDP solver outside of Python
 # ie. ./pomdpsol --precision 0.25 --timeout 50000 --output Examples/Test.policy Examples/Test.pomdp
-#   This will run for about 15 hours or until it reaches an expected reward range of 0.25 
\ No newline at end of file
+#   This will run for about 15 hours or until it reaches an expected reward range of 0.25 
+# Or solve the POMDP in-process (no file or external solver needed)
+# ie. planes, actions = dialogGenerator.Solve(timeout=600)
+# Or build and solve a whole grid of settings in parallel (see Sweep.py)
+# ie. Sweep("Examples/TestQuestions.json", [obsMat], "Examples/Sweep", discounts=[0.9, 0.99], timeout=600)
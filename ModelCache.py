@@ -0,0 +1,151 @@
+import collections
+import hashlib
+import json
+import os
+import shutil
+from numpy import *
+import AtomicFile
+from DialogModel import DialogPOMDP
+from Policy import Policy
+
+# Bump this whenever the compiled model layout changes, so that stale entries are never reused
+CACHE_VERSION = 2
+
+class ModelCache:
+
+    '''
+    Content-addressed cache of compiled dialog models
+    Each entry is keyed on a hash of the question file, the observation matrix and the reward overrides
+        and holds the compiled matrices (".npz"), the generated ".pomdp" file and any solved policies
+    Entries are evicted least recently used first once the cache grows past "maxBytes"
+    Recently used models are also kept in memory, so repeated builds in one process are free
+
+    Arguments:
+        directory -> Where the entries are stored (created if needed)
+
+        maxBytes -> Maximum total size of the entries on disk
+
+        maxMemoryEntries -> Maximum number of models kept in memory
+    '''
+    def __init__(self, directory, maxBytes=1 << 30, maxMemoryEntries=16):
+        self._Directory = directory
+        self._MaxBytes = maxBytes
+        self._MaxMemoryEntries = maxMemoryEntries
+        self._Models = collections.OrderedDict()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    '''
+    Returns the cache key (a hex digest) for a model, see DialogPOMDP for the arguments
+    '''
+    @staticmethod
+    def Key(filename, observeProb, rewards=None):
+        digest = hashlib.sha256()
+        digest.update(str(CACHE_VERSION).encode())
+        with open(filename, "rb") as f:
+            digest.update(f.read())
+        observeProb = ascontiguousarray(observeProb, dtype=float64)
+        digest.update(str(observeProb.shape).encode())
+        digest.update(observeProb.tobytes())
+        digest.update(json.dumps(rewards, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    '''
+    Returns the compiled DialogPOMDP, building and storing it only if it is not cached yet
+    '''
+    def GetModel(self, filename, observeProb, rewards=None):
+        return self._GetModel(self.Key(filename, observeProb, rewards), filename, observeProb, rewards)
+
+    '''
+    Returns the path of the generated ".pomdp" file, generating it only if it is not cached yet
+    '''
+    def GetFile(self, filename, observeProb, rewards=None):
+        key = self.Key(filename, observeProb, rewards)
+        path = os.path.join(self._Entry(key), "model.pomdp")
+        if not os.path.exists(path):
+            dialog = self._GetModel(key, filename, observeProb, rewards)
+            AtomicFile.Store(path, dialog.GenerateFile)
+            self._Evict()
+        return path
+
+    '''
+    Returns the solved Policy, solving in-process only if no policy with the same solver settings is cached
+
+    Arguments:
+        solveArgs -> Arguments for DialogPOMDP.Solve (i.e. precision, timeout, seed), part of the key
+    '''
+    def GetPolicy(self, filename, observeProb, rewards=None, **solveArgs):
+        key = self.Key(filename, observeProb, rewards)
+        solveKey = hashlib.sha256(json.dumps(solveArgs, sort_keys=True).encode()).hexdigest()[0:16]
+        path = os.path.join(self._Entry(key), "policy-" + solveKey + ".npz")
+        if not os.path.exists(path):
+            dialog = self._GetModel(key, filename, observeProb, rewards)
+            planes, actions = dialog.Solve(**solveArgs)
+            AtomicFile.Store(path, lambda temporary: savez(temporary, Planes=planes, Actions=actions))
+            self._Evict()
+        data = load(path)
+        return Policy(data["Planes"], data["Actions"], prune=False)
+
+    '''
+    Removes every entry
+    '''
+    def Clear(self):
+        self._Models.clear()
+        for key in os.listdir(self._Directory):
+            shutil.rmtree(os.path.join(self._Directory, key), ignore_errors=True)
+
+    def _GetModel(self, key, filename, observeProb, rewards):
+        if key in self._Models:
+            self._Models.move_to_end(key)
+            self._Entry(key)
+            return self._Models[key]
+
+        path = os.path.join(self._Entry(key), "model.npz")
+        if os.path.exists(path):
+            dialog = DialogPOMDP.Load(path)
+        else:
+            dialog = DialogPOMDP(filename, observeProb, rewards)
+            AtomicFile.Store(path, dialog.Save)
+            self._Evict()
+
+        self._Models[key] = dialog
+        if len(self._Models) > self._MaxMemoryEntries:
+            self._Models.popitem(last=False)
+        return dialog
+
+    '''
+    Returns the directory of an entry and marks it as recently used
+    '''
+    def _Entry(self, key):
+        path = os.path.join(self._Directory, key)
+        if not os.path.isdir(path):
+            os.makedirs(path, exist_ok=True)
+        os.utime(path, None)
+        return path
+
+    '''
+    Deletes the least recently used entries until the cache fits in "maxBytes"
+    '''
+    def _Evict(self):
+        entries = []
+        totalBytes = 0
+        for key in os.listdir(self._Directory):
+            path = os.path.join(self._Directory, key)
+            if not os.path.isdir(path):
+                continue
+            # Other processes may be adding or evicting files at the same time
+            try:
+                size = sum([os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)])
+                entries.append((os.path.getmtime(path), key, size))
+            except OSError:
+                continue
+            totalBytes += size
+
+        # Never evict the most recently used entry (it is the one being built)
+        entries.sort()
+        for lastUsed, key, size in entries[0:-1]:
+            if totalBytes <= self._MaxBytes:
+                break
+            shutil.rmtree(os.path.join(self._Directory, key), ignore_errors=True)
+            self._Models.pop(key, None)
+            totalBytes -= size
@@ -0,0 +1,229 @@
+import hashlib
+import os
+import xml.etree.ElementTree as ElementTree
+from numpy import *
+import AtomicFile
+import Profiling
+
+class Policy:
+
+    '''
+    Alpha vector policy, as produced by APPL or by Solver.py
+    The value of a belief is max(belief * planes), and the best action is the action of that plane
+        See ControlModel/Original/loadAPPLPolicy.m for more background
+    Dominated planes are pruned and the rest are kept in one contiguous float32 matrix for fast lookups
+
+    Arguments:
+        planes -> 2D matrix, one column (alpha vector) per plane, one row per state
+
+        actions -> 1D array, the index of the action for each plane
+
+        prune -> Remove planes that are pointwise dominated by another plane
+    '''
+    def __init__(self, planes, actions, prune=True):
+        planes = asarray(planes)
+        actions = asarray(actions, dtype=int32)
+        assert planes.ndim == 2
+        assert planes.shape[1] == len(actions)
+
+        if prune:
+            kept = _UndominatedPlanes(planes)
+            planes = planes[:, kept]
+            actions = actions[kept]
+
+        self.Planes = ascontiguousarray(planes, dtype=float32)
+        self.Actions = actions
+
+    '''
+    Reads an APPL policy file (XML)
+
+    Arguments:
+        filename -> Path of the ".policy" file
+
+        cacheDirectory -> Optional directory for compiled policies
+                          The pruned planes are stored there once and memory-mapped on later loads
+    '''
+    @staticmethod
+    @Profiling.Timed("Policy.Load")
+    def Load(filename, cacheDirectory=None):
+        if cacheDirectory is None:
+            planes, actions = _ParseAPPL(filename)
+            return Policy(planes, actions)
+
+        # Compiled policies are named after the contents of the policy file
+        digest = hashlib.sha1()
+        with open(filename, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        prefix = os.path.join(cacheDirectory, digest.hexdigest())
+
+        if not os.path.exists(prefix + ".actions.npy"):
+            planes, actions = _ParseAPPL(filename)
+            compiled = Policy(planes, actions)
+            os.makedirs(cacheDirectory, exist_ok=True)
+            # Each file is moved into place whole, and the actions last since their presence marks the entry as complete
+            AtomicFile.Store(prefix + ".planes.npy", lambda temporary: save(temporary, compiled.Planes))
+            AtomicFile.Store(prefix + ".actions.npy", lambda temporary: save(temporary, compiled.Actions))
+
+        policy = Policy.__new__(Policy)
+        policy.Planes = load(prefix + ".planes.npy", mmap_mode="r")
+        policy.Actions = load(prefix + ".actions.npy")
+        return policy
+
+    '''
+    Returns the value of each belief under the policy
+    Beliefs are given one per row (or a single 1D belief)
+        Beliefs with fewer entries than the policy has states are padded with zeros
+        ie. the classified states of the control model, see doControl33.m
+    '''
+    def Value(self, beliefs, chunkSize=65536):
+        return self._Evaluate(beliefs, chunkSize)[1]
+
+    '''
+    Returns the best action for each belief (same argument conventions as Value)
+    '''
+    def BestAction(self, beliefs, chunkSize=65536):
+        return self._Evaluate(beliefs, chunkSize)[0]
+
+    @Profiling.Timed("Policy.Lookup")
+    def _Evaluate(self, beliefs, chunkSize):
+        beliefs = asarray(beliefs, dtype=float32)
+        single = beliefs.ndim == 1
+        beliefs = atleast_2d(beliefs)
+        numStates = self.Planes.shape[0]
+        assert beliefs.shape[1] <= numStates
+
+        actions = empty(beliefs.shape[0], dtype=self.Actions.dtype)
+        values = empty(beliefs.shape[0], dtype=float32)
+        for start in range(0, beliefs.shape[0], chunkSize):
+            chunk = beliefs[start:(start + chunkSize)]
+            scores = chunk @ self.Planes[0:chunk.shape[1], :]
+            best = argmax(scores, axis=1)
+            actions[start:(start + chunkSize)] = self.Actions[best]
+            values[start:(start + chunkSize)] = scores[arange(len(best)), best]
+
+        if single:
+            return actions[0], values[0]
+        return actions, values
+
+class FactoredPolicy:
+
+    '''
+    Alpha vector policy for a factored model (see FactoredSolver in Solver.py)
+    Every plane belongs to one mode and covers only the classes
+        The value of a belief in a mode is max(belief * planes) over the planes of that mode
+
+    Arguments:
+        planes -> 2D matrix, one column (alpha vector) per plane, one row per class
+
+        actions -> 1D array, the index of the action for each plane
+
+        modes -> 1D array, the mode each plane applies to
+
+        prune -> Remove planes that are pointwise dominated by another plane of the same mode
+    '''
+    def __init__(self, planes, actions, modes, prune=True):
+        planes = asarray(planes)
+        actions = asarray(actions, dtype=int32)
+        modes = asarray(modes, dtype=intp)
+        assert planes.ndim == 2
+        assert planes.shape[1] == len(actions) and len(actions) == len(modes)
+
+        # The planes of each mode are kept together, so a mode's planes are one slice
+        order = argsort(modes, kind="mergesort")
+        if prune:
+            kept = []
+            for mode in unique(modes).tolist():
+                columns = order[modes[order] == mode]
+                kept.append(columns[_UndominatedPlanes(planes[:, columns])])
+            order = concatenate(kept)
+
+        self.Planes = ascontiguousarray(planes[:, order], dtype=float32)
+        self.Actions = actions[order]
+        self.Modes = modes[order]
+
+    '''
+    Returns the value of each belief under the policy
+    Beliefs are given one per row (or a single 1D belief), with the mode of each belief (or a single mode)
+    '''
+    def Value(self, modes, beliefs):
+        return self._Evaluate(modes, beliefs)[1]
+
+    '''
+    Returns the best action for each belief (same argument conventions as Value)
+    '''
+    def BestAction(self, modes, beliefs):
+        return self._Evaluate(modes, beliefs)[0]
+
+    @Profiling.Timed("FactoredPolicy.Lookup")
+    def _Evaluate(self, modes, beliefs):
+        beliefs = asarray(beliefs, dtype=float32)
+        single = beliefs.ndim == 1
+        beliefs = atleast_2d(beliefs)
+        modes = broadcast_to(asarray(modes, dtype=intp), (beliefs.shape[0],))
+
+        actions = empty(beliefs.shape[0], dtype=self.Actions.dtype)
+        values = empty(beliefs.shape[0], dtype=float32)
+        for mode in unique(modes).tolist():
+            rows = flatnonzero(modes == mode)
+            start, end = searchsorted(self.Modes, [mode, mode + 1])
+            assert end > start
+            scores = beliefs[rows] @ self.Planes[:, start:end]
+            best = argmax(scores, axis=1)
+            actions[rows] = self.Actions[start + best]
+            values[rows] = scores[arange(len(rows)), best]
+
+        if single:
+            return actions[0], values[0]
+        return actions, values
+
+'''
+Parses an APPL policy file into (planes, actions)
+Handles both the dense <Vector> and the sparse <SparseVector> formats
+'''
+def _ParseAPPL(filename):
+    planes = None
+    actions = []
+    column = 0
+    for event, element in ElementTree.iterparse(filename, events=("start", "end")):
+        if event == "start":
+            if element.tag == "AlphaVector":
+                planes = zeros((int(element.get("vectorLength")), int(element.get("numVectors"))))
+            continue
+
+        if element.tag == "Vector":
+            planes[:, column] = fromstring(element.text, sep=" ")
+        elif element.tag == "SparseVector":
+            for entry in element.findall("Entry"):
+                state, value = entry.text.split()
+                planes[int(state), column] = float(value)
+        else:
+            continue
+
+        actions.append(int(element.get("action")))
+        column += 1
+        element.clear()
+
+    assert planes is not None and column == planes.shape[1]
+    return planes, array(actions)
+
+'''
+Returns the indices of the planes that are not pointwise dominated by any other plane
+    Exact duplicates keep their first copy
+'''
+def _UndominatedPlanes(planes, maxComparisons=1 << 24):
+    numPlanes = planes.shape[1]
+    columns = planes.T
+
+    # Compare a few planes against all the others at a time to bound the memory used
+    chunkSize = int(maximum(1, maxComparisons // maximum(1, planes.size)))
+    dominated = zeros(numPlanes, dtype=bool)
+    for start in range(0, numPlanes, chunkSize):
+        chunk = columns[start:(start + chunkSize)]
+
+        # atLeast[i, j] is true when plane j is at least as good as plane (start + i) everywhere
+        atLeast = all(columns[newaxis, :, :] >= chunk[:, newaxis, :], axis=2)
+        strictly = any(columns[newaxis, :, :] > chunk[:, newaxis, :], axis=2)
+        earlier = arange(numPlanes)[newaxis, :] < arange(start, start + len(chunk))[:, newaxis]
+        dominated[start:(start + chunkSize)] = any(atLeast & (strictly | earlier), axis=1)
+    return flatnonzero(~dominated)
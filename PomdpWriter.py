@@ -0,0 +1,135 @@
+import gzip
+import sys
+from numpy import *
+
+# Number of characters collected before they are handed to the underlying file
+BUFFER_SIZE = 1 << 20
+
+'''
+Writes a POMDP input file in Cassandra's format (i.e. for APPL or pomdp-solve)
+Only nonzero entries are walked and the output is written in large buffered chunks
+
+Arguments:
+    target -> Filename, or an open text file object (i.e. a pipe to a solver)
+              Filenames ending in ".gz" are gzip compressed and "-" writes to standard output
+
+    discount, states, actions, observations -> Header of the file (labels are written as given)
+
+    initialBelief -> 1D array of start probabilities, one per state
+
+    transitions -> List of sparse transitions (see SparseTransition.py), one per action
+
+    observationMatrix -> 2D matrix, 'observationMatrix[State, Observation]' shared by all actions
+
+    rewardMatrix -> 2D matrix, 'rewardMatrix[Action, State]'
+'''
+def WritePOMDP(target, discount, states, actions, observations, initialBelief, transitions, observationMatrix, rewardMatrix):
+    if hasattr(target, "write"):
+        _WriteChunks(target, _Chunks(discount, states, actions, observations, initialBelief, transitions, observationMatrix, rewardMatrix))
+        return
+
+    if target == "-":
+        f = sys.stdout
+    elif target.endswith(".gz"):
+        f = gzip.open(target, "wt")
+    else:
+        f = open(target, "w")
+
+    try:
+        _WriteChunks(f, _Chunks(discount, states, actions, observations, initialBelief, transitions, observationMatrix, rewardMatrix))
+    finally:
+        if f is sys.stdout:
+            f.flush()
+        else:
+            f.close()
+
+'''
+Joins small chunks of text into large writes
+'''
+def _WriteChunks(f, chunks):
+    buffered = []
+    bufferedLength = 0
+    for chunk in chunks:
+        buffered.append(chunk)
+        bufferedLength += len(chunk)
+        if bufferedLength >= BUFFER_SIZE:
+            f.write("".join(buffered))
+            buffered = []
+            bufferedLength = 0
+    if buffered:
+        f.write("".join(buffered))
+
+def _FormatRow(row):
+    return " ".join(map(repr, row.tolist()))
+
+'''
+Generates the text of the POMDP file one section at a time
+'''
+def _Chunks(discount, states, actions, observations, initialBelief, transitions, observationMatrix, rewardMatrix):
+    # Give a time discounting factor (to prevent the POMDP from gathering info infinitely)
+    yield "discount: " + repr(float(discount)) + "\n"
+
+    # Use a reward function for maximization (as opposed to a cost function for minimization)
+    yield "values: reward\n"
+
+    #################################################################
+    ##                           Labels                            ##
+    #################################################################
+    yield "states: " + " ".join(states) + "\n"
+    yield "actions: " + " ".join(actions) + "\n"
+    yield "observations: " + " ".join(observations) + "\n"
+
+    #################################################################
+    ##                       Initial Belief                        ##
+    #################################################################
+    yield "start: " + _FormatRow(asarray(initialBelief, dtype=float)) + "\n"
+
+    #################################################################
+    ##                      Transition matrix                      ##
+    #################################################################
+    # Actions that keep every state in place are written as the identity matrix
+    # Otherwise whichever form is shorter:
+    #     One entry per state (unlisted entries are 0)
+    #     The identity matrix, then two lines per moving state, one that clears its diagonal and one that sets its target
+    #         (later entries take precedence, so the 0 is needed to keep the row summing to 1)
+    # Every entry is on its own line, since some parsers of this format read one entry per line
+    for action, transition in zip(actions, transitions):
+        sources, targets = transition.Moves()
+        moving = flatnonzero(sources != targets)
+        if len(moving) == 0:
+            yield "T : " + action + "\nidentity\n"
+        elif 2 * len(moving) + 1 >= len(states):
+            successors = arange(len(states))
+            successors[sources] = targets
+            yield "".join(["T : %s : %s : %s 1\n" % (action, state, states[target])
+                           for state, target in zip(states, successors.tolist())])
+        else:
+            yield "T : " + action + "\nidentity\n"
+            yield "".join(["T : %s : %s : %s 0\nT : %s : %s : %s 1\n" % (action, states[source], states[source], action, states[source], states[target])
+                           for source, target in zip(sources[moving].tolist(), targets[moving].tolist())])
+
+    #################################################################
+    ##               Observation Probability Matrix                ##
+    #################################################################
+    # The observations do not depend on the action, so a single matrix covers every action
+    yield "O : *\n"
+    for row in observationMatrix:
+        yield _FormatRow(row) + "\n"
+
+    #################################################################
+    ##                        Reward Matrix                        ##
+    #################################################################
+    # Each row is written as a default value, followed by the states that differ from it
+    #     The default is the most common value, or 0 (which needs no line) whenever that is no longer
+    #     Zeros are therefore only written where they override a nonzero default
+    for action, row in zip(actions, rewardMatrix):
+        values, counts = unique(row, return_counts=True)
+        common = values[argmax(counts)]
+        if count_nonzero(row) <= count_nonzero(row != common) + 1:
+            common = 0
+        lines = []
+        if common != 0:
+            lines.append("R : %s : * : * : * %r\n" % (action, float(common)))
+        for stateIndex in flatnonzero(row != common).tolist():
+            lines.append("R : %s : %s : * : * %r\n" % (action, states[stateIndex], float(row[stateIndex])))
+        yield "".join(lines)
@@ -0,0 +1,125 @@
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+'''
+Opt-in timing of the stages of the library (model build, export, solve, policy lookup, control loop)
+Nothing is recorded unless profiling is enabled, either
+    in code                   -> Profiling.Enable()
+    or from the environment   -> POMDPY_PROFILE=1
+                                 POMDPY_PROFILE_OUTPUT=<path> also writes the report there as JSON when the process exits
+                                 (otherwise a summary is printed to standard error on exit)
+While disabled, an instrumented call only costs one extra function call and a flag check
+
+Usage:
+    @Profiling.Timed("Stage name")
+    def Function(...):
+
+    with Profiling.Stage("Stage name"):
+        ...
+'''
+
+_Enabled = False
+_Lock = threading.Lock()
+_Stats = {}    # Stage name -> [calls, total seconds, max seconds]
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return False
+
+class _TimedStage:
+    def __init__(self, name):
+        self._Name = name
+
+    def __enter__(self):
+        self._Start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        Record(self._Name, time.perf_counter() - self._Start)
+        return False
+
+_NULL_STAGE = _NullStage()
+
+def Enable():
+    global _Enabled
+    _Enabled = True
+
+def Disable():
+    global _Enabled
+    _Enabled = False
+
+def IsEnabled():
+    return _Enabled
+
+'''
+Adds one timed call of a stage
+'''
+def Record(name, seconds):
+    with _Lock:
+        stats = _Stats.get(name)
+        if stats is None:
+            _Stats[name] = [1, seconds, seconds]
+        else:
+            stats[0] += 1
+            stats[1] += seconds
+            if seconds > stats[2]:
+                stats[2] = seconds
+
+'''
+Returns a context manager that times its block as one call of the stage (does nothing while disabled)
+'''
+def Stage(name):
+    if _Enabled:
+        return _TimedStage(name)
+    return _NULL_STAGE
+
+'''
+Decorator that times every call of a function as one call of the stage
+'''
+def Timed(name):
+    def decorate(function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            if not _Enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                Record(name, time.perf_counter() - start)
+        return timed
+    return decorate
+
+'''
+Returns {stage name : {"Calls", "Seconds", "MeanSeconds", "MaxSeconds"}} for everything recorded so far
+'''
+def Report():
+    with _Lock:
+        return dict((name, {"Calls" : calls, "Seconds" : total, "MeanSeconds" : total / calls, "MaxSeconds" : longest})
+                    for name, (calls, total, longest) in _Stats.items())
+
+def Reset():
+    with _Lock:
+        _Stats.clear()
+
+def _WriteReport(path):
+    report = Report()
+    if path:
+        with open(path, "w") as f:
+            json.dump(report, f, indent=4, sort_keys=True)
+        return
+    for name in sorted(report.keys()):
+        stats = report[name]
+        sys.stderr.write("%-40s %8d calls %12.6f s total %12.6f s mean %12.6f s max\n" % (name, stats["Calls"], stats["Seconds"], stats["MeanSeconds"], stats["MaxSeconds"]))
+
+if os.environ.get("POMDPY_PROFILE", "0") not in ("", "0"):
+    Enable()
+    atexit.register(_WriteReport, os.environ.get("POMDPY_PROFILE_OUTPUT"))
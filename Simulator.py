@@ -0,0 +1,245 @@
+import concurrent.futures
+import os
+from numpy import *
+import Profiling
+
+'''
+Evaluates a policy on a dialog model by simulating many episodes at once (no live user needed)
+Each episode draws a true classification from the initial belief, then follows the policy
+    until it classifies (reaches a terminal state) or runs out of steps
+
+Arguments:
+    dialog -> The DialogPOMDP or FactoredDialogPOMDP to simulate
+
+    policy -> Anything with a BestAction(beliefs) method taking one belief per row (i.e. Policy.py)
+                  or a BestAction(modes, beliefs) method for a FactoredDialogPOMDP (i.e. FactoredPolicy)
+              or "greedy" (best immediate expected reward) or "random" (uniformly random actions)
+
+    episodes -> Number of episodes to simulate
+
+    maxSteps -> Episodes that have not classified after this many steps are stopped (and count as wrong)
+
+    seed -> Seed for the random streams, the results only depend on the seed (not on "workers")
+
+    workers -> Number of processes to spread the episodes over (None uses every core, 1 stays in-process)
+
+    chunkSize -> Number of episodes simulated together as one batch of arrays
+
+Returns a dictionary with
+    "Reward"         -> Mean discounted reward
+    "RewardStdError" -> Standard error of the mean discounted reward
+    "Questions"      -> Mean number of questions asked
+    "Steps"          -> Mean number of steps taken
+    "Accuracy"       -> Fraction of episodes that classified correctly
+    "Finished"       -> Fraction of episodes that classified at all
+'''
+@Profiling.Timed("Simulate")
+def Simulate(dialog, policy, episodes=10000, maxSteps=100, seed=None, workers=None, chunkSize=1000):
+    chunks = [int(minimum(chunkSize, episodes - start)) for start in range(0, episodes, chunkSize)]
+    seeds = random.SeedSequence(seed).spawn(len(chunks))
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = int(minimum(workers, len(chunks)))
+
+    if workers <= 1:
+        results = [_SimulateChunk(dialog, policy, count, maxSteps, chunkSeed) for count, chunkSeed in zip(chunks, seeds)]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_SimulateChunk, [dialog] * len(chunks), [policy] * len(chunks), chunks, [maxSteps] * len(chunks), seeds))
+
+    rewards, questions, steps, correct, finished = [concatenate(values) for values in zip(*results)]
+    return {
+        "Reward"         : float(rewards.mean()),
+        "RewardStdError" : float(rewards.std() / sqrt(len(rewards))),
+        "Questions"      : float(questions.mean()),
+        "Steps"          : float(steps.mean()),
+        "Accuracy"       : float(correct.mean()),
+        "Finished"       : float(finished.mean()),
+    }
+
+'''
+Simulates one batch of episodes, returns per-episode arrays (see Simulate)
+'''
+def _SimulateChunk(dialog, policy, count, maxSteps, seed):
+    rng = random.default_rng(seed)
+    model = _FactoredDialog(dialog) if hasattr(dialog, "NumModes") else _FlatDialog(dialog)
+
+    states = model.InitialStates(rng, count)
+    trueClasses = model.StateClasses(states)
+    beliefs = model.InitialBeliefs(count)
+
+    rewards = zeros(count)
+    questions = zeros(count, dtype=intp)
+    steps = zeros(count, dtype=intp)
+    classified = full(count, -1, dtype=intp)
+    active = arange(count)
+    discount = 1.0
+
+    for step in range(maxSteps):
+        if len(active) == 0:
+            break
+
+        if isinstance(policy, str) and policy == "random":
+            actions = rng.integers(model.NumActions, size=len(active))
+        elif isinstance(policy, str) and policy == "greedy":
+            actions = argmax(model.ExpectedRewards(beliefs), axis=1)
+        else:
+            actions = model.BestActions(policy, beliefs)
+
+        rewards[active] += discount * model.Rewards(states, actions)
+        questions[active] += model.QuestionActions[actions]
+        steps[active] += 1
+        discount *= model.Discount
+
+        states = model.NextStates(states, actions)
+        observations = model.SampleObservations(rng, states)
+        beliefs = model.UpdateBeliefs(beliefs, actions, observations)
+
+        # Episodes that reached a terminal state are done
+        done = model.TerminalStates(states)
+        classified[active[done]] = model.ActionClasses[actions[done]]
+        active = active[~done]
+        states = states[~done]
+        beliefs = model.SelectBeliefs(beliefs, ~done)
+
+    finished = classified >= 0
+    return rewards, questions, steps, finished & (classified == trueClasses), finished
+
+class _FlatDialog:
+
+    '''
+    Batched view of the flattened DialogPOMDP matrices for simulation
+    States, actions and observations are all indices, one entry per episode
+    '''
+    def __init__(self, dialog):
+        classCount = len(dialog._Model["Classifications"])
+        questionCount = len(dialog._Questions)
+        numStates = len(dialog._States)
+        terminalStart = (1 + questionCount) * classCount
+
+        self.NumActions = len(dialog._Actions)
+        self.Discount = float(dialog._Model["Time Discount"])
+        self._InitialBelief = asarray(dialog._InitialBelief, dtype=float)
+        self._RewardMatrix = dialog._RewardMatrix
+        self._ObservationMatrix = dialog._ObservationMatrix
+        self._CumulativeObservations = cumsum(dialog._ObservationMatrix, axis=1)
+        self._Successors = array([dialog._TransitionMatrix[action].Successors() for action in dialog._Actions])
+
+        # The classification held by each general and question state (terminal states only know what was chosen)
+        self._StateClasses = arange(numStates) % classCount
+        self._TerminalStates = arange(numStates) >= terminalStart
+
+        # The classification made by each action (-1 for the others), and which actions ask a question
+        self.ActionClasses = full(self.NumActions, -1, dtype=intp)
+        self.QuestionActions = zeros(self.NumActions, dtype=intp)
+        for actionIndex, action in enumerate(dialog._Actions):
+            if action.startswith("cA_"):
+                self.ActionClasses[actionIndex] = dialog._Model["Classifications"].index(action[3:])
+            elif action.startswith("qA_"):
+                self.QuestionActions[actionIndex] = 1
+
+    def InitialStates(self, rng, count):
+        return rng.choice(len(self._InitialBelief), size=count, p=self._InitialBelief / self._InitialBelief.sum())
+
+    def InitialBeliefs(self, count):
+        return tile(self._InitialBelief, (count, 1))
+
+    def StateClasses(self, states):
+        return self._StateClasses[states]
+
+    def TerminalStates(self, states):
+        return self._TerminalStates[states]
+
+    def SelectBeliefs(self, beliefs, episodes):
+        return beliefs[episodes]
+
+    def BestActions(self, policy, beliefs):
+        return asarray(policy.BestAction(beliefs), dtype=intp)
+
+    def Rewards(self, states, actions):
+        return self._RewardMatrix[actions, states]
+
+    def ExpectedRewards(self, beliefs):
+        return beliefs @ self._RewardMatrix.T
+
+    def NextStates(self, states, actions):
+        return self._Successors[actions, states]
+
+    def SampleObservations(self, rng, states):
+        draws = rng.random(len(states))[:, newaxis]
+        return minimum(sum(self._CumulativeObservations[states] < draws, axis=1), self._ObservationMatrix.shape[1] - 1)
+
+    '''
+    Pushes each belief through its own action's transition, then conditions it on its observation
+    '''
+    def UpdateBeliefs(self, beliefs, actions, observations):
+        count, numStates = beliefs.shape
+        targets = self._Successors[actions] + (numStates * arange(count))[:, newaxis]
+        propagated = bincount(targets.ravel(), weights=beliefs.ravel(), minlength=count * numStates).reshape(count, numStates)
+        propagated *= self._ObservationMatrix[:, observations].T
+        totals = propagated.sum(axis=1)
+        return where(totals[:, newaxis] > 0, propagated / maximum(totals, 1e-300)[:, newaxis], beliefs)
+
+class _FactoredDialog:
+
+    '''
+    Batched view of a FactoredDialogPOMDP for simulation, with the same interface as _FlatDialog
+    States are encoded as (mode * # of classes + class) and beliefs are (modes, class beliefs) pairs
+    '''
+    def __init__(self, dialog):
+        self._Dialog = dialog
+        self._ClassCount = dialog.NumClasses
+        self._TerminalStart = dialog.NumModes - dialog.NumClasses
+
+        self.NumActions = dialog.NumActions
+        self.Discount = dialog.Discount
+
+        # Asking moves from the general mode into a question mode, classifying into a terminal mode
+        generalNextModes = dialog.NextModes(dialog.GENERAL_MODE, arange(self.NumActions))
+        self.ActionClasses = where(generalNextModes >= self._TerminalStart, generalNextModes - self._TerminalStart, -1)
+        self.QuestionActions = ((generalNextModes > dialog.GENERAL_MODE) & (generalNextModes < self._TerminalStart)).astype(intp)
+
+    def InitialStates(self, rng, count):
+        initialBelief = asarray(self._Dialog.InitialBelief, dtype=float)
+        classes = rng.choice(self._ClassCount, size=count, p=initialBelief / initialBelief.sum())
+        return self._Dialog.InitialMode * self._ClassCount + classes
+
+    def InitialBeliefs(self, count):
+        return full(count, self._Dialog.InitialMode, dtype=intp), tile(asarray(self._Dialog.InitialBelief, dtype=float), (count, 1))
+
+    def StateClasses(self, states):
+        return states % self._ClassCount
+
+    def TerminalStates(self, states):
+        return states // self._ClassCount >= self._TerminalStart
+
+    def SelectBeliefs(self, beliefs, episodes):
+        return beliefs[0][episodes], beliefs[1][episodes]
+
+    def BestActions(self, policy, beliefs):
+        return asarray(policy.BestAction(beliefs[0], beliefs[1]), dtype=intp)
+
+    def Rewards(self, states, actions):
+        return self._Dialog.Rewards(states // self._ClassCount, actions, states % self._ClassCount)
+
+    def ExpectedRewards(self, beliefs):
+        modes, classBeliefs = beliefs
+        expected = empty((len(modes), self.NumActions))
+        for mode in unique(modes).tolist():
+            episodes = flatnonzero(modes == mode)
+            expected[episodes] = classBeliefs[episodes] @ self._Dialog.ModeRewards(mode).T
+        return expected
+
+    def NextStates(self, states, actions):
+        return self._Dialog.NextModes(states // self._ClassCount, actions) * self._ClassCount + states % self._ClassCount
+
+    def SampleObservations(self, rng, states):
+        return self._Dialog.SampleObservations(rng, states // self._ClassCount, states % self._ClassCount)
+
+    '''
+    Moves each belief into its action's mode, then conditions the class belief on its observation
+    '''
+    def UpdateBeliefs(self, beliefs, actions, observations):
+        modes = self._Dialog.NextModes(beliefs[0], actions)
+        return modes, self._Dialog.UpdateBeliefs(modes, beliefs[1], observations)
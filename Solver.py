@@ -0,0 +1,531 @@
+import time
+from numpy import *
+
+# Upper bound on the rounds of random walks used to collect belief points
+MAX_COLLECTION_ROUNDS = 100
+
+# Default precision of Solve, a bound on the value that further iterations could still add (see PointBasedSolver.Solve)
+#   This is not APPL's precision, which bounds the gap between its lower and upper bounds
+DEFAULT_PRECISION = 0.05
+
+class PointBasedSolver:
+
+    '''
+    Point-based value iteration (Perseus style) for POMDPs with deterministic sparse transitions
+    Produces the same kind of policy as APPL: a set of alpha vectors with one action per vector
+        The value of a belief is max(belief * planes), and the best action is the action of that plane
+    All alpha vector backups over the belief set are done as batched matrix operations
+
+    Arguments:
+        transitions -> List of sparse transitions (see SparseTransition.py), one per action
+
+        observationMatrix -> 2D matrix, 'observationMatrix[State, Observation]'
+                             Probability of each observation after arriving in a state (shared by all actions)
+
+        rewardMatrix -> 2D matrix, 'rewardMatrix[Action, State]'
+
+        discount -> Time discount between 0 and 1 (exclusive)
+
+        initialBelief -> 1D array of start probabilities, one per state
+
+        beliefCount -> Maximum number of belief points to back up
+
+        beliefDepth -> Number of random steps taken from the initial belief when collecting belief points
+
+        seed -> Seed for the random exploration that collects belief points
+    '''
+    def __init__(self, transitions, observationMatrix, rewardMatrix, discount, initialBelief, beliefCount=500, beliefDepth=20, seed=None):
+        self._Transitions = list(transitions)
+        self._ObservationMatrix = asarray(observationMatrix, dtype=float)
+        self._RewardMatrix = array(rewardMatrix, dtype=float)
+        self._Discount = float(discount)
+        self._InitialBelief = asarray(initialBelief, dtype=float)
+
+        assert len(self._Transitions) == self._RewardMatrix.shape[0]
+        assert self._ObservationMatrix.shape[0] == self._RewardMatrix.shape[1]
+        assert len(self._InitialBelief) == self._RewardMatrix.shape[1]
+        assert self._Discount >= 0 and self._Discount < 1, "The in-process solvers need a time discount below 1 (got %r)" % self._Discount
+
+        self._Successors = array([transition.Successors() for transition in self._Transitions])
+        self._CumulativeObservations = cumsum(self._ObservationMatrix, axis=1)
+        self._Random = random.default_rng(seed)
+        self.Beliefs = self._CollectBeliefs(beliefCount, beliefDepth)
+
+        # The alpha vectors found so far, see Solve
+        self._Planes = None
+
+    '''
+    Explores the belief space with random walks from the initial belief and returns the visited beliefs (one per row)
+        In each state a walk picks uniformly between staying put and each action that moves the state
+        so that a few wasted actions do not drown out the questions and classifications (see _CollectPoints)
+    '''
+    def _CollectBeliefs(self, beliefCount, beliefDepth):
+        return _CollectPoints(self, self._Random, beliefCount, beliefDepth)
+
+    '''
+    Starts walks at the initial belief, returns (beliefs, states, locations) where the states are drawn from the initial belief
+    '''
+    def _StartWalks(self, walkCount):
+        beliefs = tile(self._InitialBelief, (walkCount, 1))
+        states = self._Random.choice(len(self._InitialBelief), size=walkCount, p=self._InitialBelief / sum(self._InitialBelief))
+        return beliefs, states, states
+
+    '''
+    Returns the actions a walk picks from in a state: every action that moves it, and one that does not
+    '''
+    def _WalkChoices(self, state):
+        return concatenate((flatnonzero(self._Successors[:, state] != state), flatnonzero(self._Successors[:, state] == state)[0:1]))
+
+    '''
+    Takes one step of each walk, then samples an observation from the new state and conditions the belief on it
+    '''
+    def _StepWalks(self, beliefs, states, actions):
+        nextBeliefs = empty_like(beliefs)
+        for action in unique(actions).tolist():
+            walks = flatnonzero(actions == action)
+            nextBeliefs[walks] = self._Transitions[action].Propagate(beliefs[walks])
+        states = self._Successors[actions, states]
+
+        draws = self._Random.random(len(states))[:, newaxis]
+        observations = minimum(sum(self._CumulativeObservations[states] < draws, axis=1), self._ObservationMatrix.shape[1] - 1)
+        nextBeliefs *= self._ObservationMatrix[:, observations].T
+        totals = sum(nextBeliefs, axis=1)
+        beliefs = where(totals[:, newaxis] > 0, nextBeliefs / maximum(totals, 1e-300)[:, newaxis], beliefs)
+        return beliefs, states, states
+
+    '''
+    Returns the most pessimistic policy: always take the action whose worst reward is best
+        Its value is a lower bound on the optimal value everywhere
+    '''
+    def _LowerBound(self):
+        worstRewards = self._RewardMatrix.min(axis=1)
+        action = argmax(worstRewards)
+        planes = full((self._RewardMatrix.shape[1], 1), worstRewards[action] / (1 - self._Discount))
+        return planes, array([action])
+
+    '''
+    Backs up every belief point against the current alpha vectors
+    Returns the new alpha vector (one column per belief), its action, its value at the belief
+        and the plane it continues with after each observation ('[Belief, Observation]')
+    '''
+    def _Backup(self, beliefs, planes):
+        numBeliefs = beliefs.shape[0]
+        numObservations = self._ObservationMatrix.shape[1]
+        bestValues = full(numBeliefs, -inf)
+        bestPlanes = empty((planes.shape[0], numBeliefs))
+        bestActions = zeros(numBeliefs, dtype=intp)
+        bestReferences = zeros((numBeliefs, numObservations), dtype=intp)
+
+        for action, transition in enumerate(self._Transitions):
+            # Belief after the transition, before the observation
+            propagated = transition.Propagate(beliefs)
+
+            # For each observation, pick the alpha vector that is best for the conditioned belief
+            #   and accumulate the observation-weighted vector on the end states
+            future = zeros((planes.shape[0], numBeliefs))
+            references = empty((numBeliefs, numObservations), dtype=intp)
+            for observation in range(numObservations):
+                weights = self._ObservationMatrix[:, observation]
+                choices = argmax((propagated * weights) @ planes, axis=1)
+                future += weights[:, newaxis] * planes[:, choices]
+                references[:, observation] = choices
+
+            # Pull the future values back onto the start states
+            candidates = self._RewardMatrix[action][:, newaxis] + self._Discount * transition.Backup(future)
+            values = einsum("ij,ji->i", beliefs, candidates)
+
+            improved = values > bestValues
+            bestValues[improved] = values[improved]
+            bestPlanes[:, improved] = candidates[:, improved]
+            bestActions[improved] = action
+            bestReferences[improved] = references[improved]
+
+        return bestPlanes, bestActions, bestValues, bestReferences
+
+    '''
+    Adds a change in rewards to the model, i.e. after reward feedback
+    The belief points are kept and the stored alpha vectors are re-evaluated under the new rewards
+        so a later Solve starts from the previous policy rather than from scratch
+
+    Arguments:
+        rewardDelta -> 2D matrix the same shape as the reward matrix, '[Action, State]'
+    '''
+    def UpdateRewards(self, rewardDelta):
+        self._RewardMatrix += rewardDelta
+        if self._Planes is None:
+            return
+
+        # Every alpha vector is the value of its action followed by the vectors it references
+        #   so the vectors are recomputed level by level, starting from the lower bound
+        lowerPlanes, lowerActions = self._LowerBound()
+        leaves = flatnonzero(self._Levels == 0)
+        self._Planes[:, leaves] = lowerPlanes
+        self._Actions[leaves] = lowerActions
+        for level in range(1, int(self._Levels.max()) + 1):
+            columns = flatnonzero(self._Levels == level)
+            for action in unique(self._Actions[columns]).tolist():
+                actionColumns = columns[self._Actions[columns] == action]
+                future = zeros((self._Planes.shape[0], len(actionColumns)))
+                for observation in range(self._ObservationMatrix.shape[1]):
+                    weights = self._ObservationMatrix[:, observation]
+                    future += weights[:, newaxis] * self._Planes[:, self._References[actionColumns, observation]]
+                self._Planes[:, actionColumns] = self._RewardMatrix[action][:, newaxis] + self._Discount * self._Transitions[action].Backup(future)
+
+    '''
+    Runs value iteration until the values at the belief points have converged, or time runs out
+    The solver can be stopped at any time and the returned policy is always usable
+        A second call continues from where the first one stopped (i.e. after UpdateRewards)
+
+    Alpha vectors are only added where they improve the value of a belief point (Perseus)
+        and every vector that a kept vector continues with is kept too
+    So the value of each vector is what the policy actually earns from it, and never an overestimate
+
+    Arguments:
+        precision -> Stop once the largest improvement of an iteration, times discount / (1 - discount), is at most this
+                     ie. a bound on how much more value further iterations could add at the belief points
+
+        timeout -> Stop after this many seconds (None means no limit)
+
+        maxIterations -> Stop after this many iterations (None means no limit)
+
+    Returns (planes, actions) in the same layout as loadAPPLPolicy.m
+        planes  -> 2D matrix, one column (alpha vector) per plane, one row per state
+        actions -> 1D array, the index of the action for each plane
+    '''
+    def Solve(self, precision=DEFAULT_PRECISION, timeout=None, maxIterations=None):
+        startTime = time.time()
+
+        if self._Planes is None:
+            self._Planes, actions = self._LowerBound()
+            self._Actions = array(actions, dtype=intp)
+            self._References = full((1, self._ObservationMatrix.shape[1]), -1, dtype=intp)
+            self._Levels = zeros(1, dtype=intp)
+
+        beliefs = self.Beliefs
+        iteration = 0
+        while True:
+            values = (beliefs @ self._Planes).max(axis=1)
+            newPlanes, newActions, newValues, newReferences = self._Backup(beliefs, self._Planes)
+            residual = (newValues - values).max()
+
+            # Only the vectors that improve their belief point are added
+            improved = flatnonzero(newValues > values)
+            planes = concatenate((self._Planes, newPlanes[:, improved]), axis=1)
+            references = concatenate((self._References, newReferences[improved]))
+            levels = concatenate((self._Levels, 1 + self._Levels[newReferences[improved]].max(axis=1)))
+            actions = concatenate((self._Actions, newActions[improved]))
+
+            # Keep the vectors that are best somewhere in the belief set, the lower bound, and whatever they continue with
+            roots = concatenate((argmax(beliefs @ planes, axis=1), flatnonzero(levels == 0)))
+            columns, self._References = _ReachablePlanes(around(planes, 9), references, roots)
+            self._Planes = planes[:, columns]
+            self._Actions = actions[columns]
+            self._Levels = levels[columns]
+            iteration += 1
+
+            if residual * self._Discount / (1 - self._Discount) <= precision:
+                break
+            if timeout is not None and time.time() - startTime >= timeout:
+                break
+            if maxIterations is not None and iteration >= maxIterations:
+                break
+
+        self.Iterations = iteration
+        return self._Planes.copy(), self._Actions.copy()
+
+class FactoredSolver:
+
+    '''
+    Point-based value iteration (Perseus style) for POMDPs whose state is a known mode plus a hidden class
+        ie. FactoredDialogPOMDP in DialogModel.py, where the mode always moves deterministically and the class never changes
+    Each alpha vector covers only the classes and belongs to one mode, so vectors are (# of classes) long
+        The value of a belief in a mode is max(belief * planes) over the planes of that mode
+
+    Arguments:
+        model -> The factored model, which provides
+                     NumModes, NumClasses, NumActions, Discount, InitialMode, InitialBelief
+                     NextModes(modes, actions)                      -> Mode reached by each action
+                     ModeRewards(mode)                              -> '[Action, Class]' rewards in a mode
+                     WorstRewards()                                 -> Worst reward of each action
+                     ModeObservations(mode)                         -> '[Class, Observation]' on arriving in a mode (None if uninformative)
+                     SampleObservations(rng, modes, classes)        -> One observation per episode
+                     UpdateBeliefs(modes, beliefs, observations)    -> Class beliefs conditioned on the observations
+
+        beliefCount, beliefDepth, seed -> Same as PointBasedSolver
+    '''
+    def __init__(self, model, beliefCount=500, beliefDepth=20, seed=None):
+        self._Model = model
+        self._Discount = float(model.Discount)
+        assert self._Discount >= 0 and self._Discount < 1, "The in-process solvers need a time discount below 1 (got %r)" % self._Discount
+
+        # Each plane refers to one plane per observation of the mode it moves to (uninformative modes count as one observation)
+        self._ModeObservations = [model.ModeObservations(mode) for mode in range(model.NumModes)]
+        self._ReferenceCount = int(max([1] + [matrix.shape[1] for matrix in self._ModeObservations if matrix is not None]))
+
+        self._Random = random.default_rng(seed)
+        self.Modes, self.Beliefs = self._CollectBeliefs(beliefCount, beliefDepth)
+
+        # The alpha vectors found so far, see Solve
+        self._Planes = None
+
+    '''
+    Explores the belief space with random walks from the initial belief and returns the visited (modes, beliefs)
+        In each mode a walk picks uniformly between staying put and each action that leaves the mode
+        so that a few wasted actions do not drown out the questions and classifications (see _CollectPoints)
+    '''
+    def _CollectBeliefs(self, beliefCount, beliefDepth):
+        points = _CollectPoints(self, self._Random, beliefCount, beliefDepth)
+        return points[:, 0].astype(intp), points[:, 1:]
+
+    '''
+    Starts walks in the initial mode and belief, returns (points, classes, modes) where the classes are drawn from the initial belief
+        Each point is the mode followed by the class belief
+    '''
+    def _StartWalks(self, walkCount):
+        model = self._Model
+        initialBelief = asarray(model.InitialBelief, dtype=float)
+        modes = full(walkCount, model.InitialMode, dtype=intp)
+        classes = self._Random.choice(model.NumClasses, size=walkCount, p=initialBelief / sum(initialBelief))
+        return column_stack((modes, tile(initialBelief, (walkCount, 1)))), classes, modes
+
+    '''
+    Returns the actions a walk picks from in a mode: every action that leaves it, and one that does not
+    '''
+    def _WalkChoices(self, mode):
+        nextModes = self._Model.NextModes(mode, arange(self._Model.NumActions))
+        return concatenate((flatnonzero(nextModes != mode), flatnonzero(nextModes == mode)[0:1]))
+
+    '''
+    Takes one step of each walk, then samples an observation in the new mode and conditions the belief on it
+    '''
+    def _StepWalks(self, points, classes, actions):
+        model = self._Model
+        modes = model.NextModes(points[:, 0].astype(intp), actions)
+        observations = model.SampleObservations(self._Random, modes, classes)
+        beliefs = model.UpdateBeliefs(modes, points[:, 1:], observations)
+        return column_stack((modes, beliefs)), classes, modes
+
+    '''
+    Returns the most pessimistic policy (see PointBasedSolver), with one plane for every mode
+    '''
+    def _LowerBound(self):
+        worstRewards = self._Model.WorstRewards()
+        action = argmax(worstRewards)
+        planes = full((self._Model.NumClasses, self._Model.NumModes), worstRewards[action] / (1 - self._Discount))
+        return planes, full(self._Model.NumModes, action, dtype=intp), arange(self._Model.NumModes)
+
+    '''
+    Returns the value of each belief and the column of its best plane
+        The planes must be sorted by mode
+    '''
+    def _Evaluate(self, modes, beliefs, planes, planeModes):
+        values = empty(len(modes))
+        choices = empty(len(modes), dtype=intp)
+        for mode in unique(modes).tolist():
+            rows = flatnonzero(modes == mode)
+            start, end = searchsorted(planeModes, [mode, mode + 1])
+            scores = beliefs[rows] @ planes[:, start:end]
+            best = argmax(scores, axis=1)
+            values[rows] = scores[arange(len(rows)), best]
+            choices[rows] = start + best
+        return values, choices
+
+    '''
+    Returns the expected discounted future alpha vector (one column per belief) after arriving in a mode
+        and the plane it continues with after each observation ('[Belief, Observation]', -1 past the mode's observations)
+        The planes must be sorted by mode
+    '''
+    def _Future(self, beliefs, mode, planes, planeModes):
+        start, end = searchsorted(planeModes, [mode, mode + 1])
+        modePlanes = planes[:, start:end]
+        references = full((beliefs.shape[0], self._ReferenceCount), -1, dtype=intp)
+        observationMatrix = self._ModeObservations[mode]
+        if observationMatrix is None:
+            choices = argmax(beliefs @ modePlanes, axis=1)
+            references[:, 0] = start + choices
+            return modePlanes[:, choices], references
+
+        # For each observation, pick the alpha vector that is best for the conditioned belief
+        future = zeros((planes.shape[0], beliefs.shape[0]))
+        for observation in range(observationMatrix.shape[1]):
+            weights = observationMatrix[:, observation]
+            choices = argmax((beliefs * weights) @ modePlanes, axis=1)
+            future += weights[:, newaxis] * modePlanes[:, choices]
+            references[:, observation] = start + choices
+        return future, references
+
+    '''
+    Backs up every belief point against the current alpha vectors (see PointBasedSolver)
+        Actions that lead to the same mode share the same future, so it is only computed once per mode reached
+    '''
+    def _Backup(self, planes, planeModes):
+        model = self._Model
+        numBeliefs = self.Beliefs.shape[0]
+        bestValues = full(numBeliefs, -inf)
+        bestPlanes = empty((planes.shape[0], numBeliefs))
+        bestActions = zeros(numBeliefs, dtype=intp)
+        bestReferences = zeros((numBeliefs, self._ReferenceCount), dtype=intp)
+
+        for mode in unique(self.Modes).tolist():
+            rows = flatnonzero(self.Modes == mode)
+            beliefs = self.Beliefs[rows]
+            rewards = model.ModeRewards(mode)
+            nextModes = model.NextModes(mode, arange(model.NumActions))
+            immediate = beliefs @ rewards.T
+
+            for nextMode in unique(nextModes).tolist():
+                actions = flatnonzero(nextModes == nextMode)
+                future, references = self._Future(beliefs, nextMode, planes, planeModes)
+                futureValues = einsum("ij,ji->i", beliefs, future)
+
+                # The best of the actions that reach this mode only differs by its immediate reward
+                best = argmax(immediate[:, actions], axis=1)
+                values = immediate[arange(len(rows)), actions[best]] + self._Discount * futureValues
+                improved = values > bestValues[rows]
+                bestValues[rows[improved]] = values[improved]
+                bestActions[rows[improved]] = actions[best[improved]]
+                bestPlanes[:, rows[improved]] = rewards[actions[best[improved]]].T + self._Discount * future[:, improved]
+                bestReferences[rows[improved]] = references[improved]
+
+        return bestPlanes, bestActions, bestValues, bestReferences
+
+    '''
+    Runs value iteration until the values at the belief points have converged, or time runs out (see PointBasedSolver)
+        A second call continues from where the first one stopped
+
+    Arguments:
+        precision, timeout, maxIterations -> Same as PointBasedSolver
+
+    Returns (planes, actions, modes), sorted by mode
+        planes  -> 2D matrix, one column (alpha vector) per plane, one row per class
+        actions -> 1D array, the index of the action for each plane
+        modes   -> 1D array, the mode each plane applies to (every mode has at least one plane)
+    '''
+    def Solve(self, precision=DEFAULT_PRECISION, timeout=None, maxIterations=None):
+        startTime = time.time()
+
+        if self._Planes is None:
+            self._Planes, self._Actions, self._PlaneModes = self._LowerBound()
+            self._References = full((self._Model.NumModes, self._ReferenceCount), -1, dtype=intp)
+
+        iteration = 0
+        while True:
+            values, _ = self._Evaluate(self.Modes, self.Beliefs, self._Planes, self._PlaneModes)
+            newPlanes, newActions, newValues, newReferences = self._Backup(self._Planes, self._PlaneModes)
+            residual = (newValues - values).max()
+
+            # Only the vectors that improve their belief point are added, after the old vectors of the same mode
+            improved = flatnonzero(newValues > values)
+            planeModes = concatenate((self._PlaneModes, self.Modes[improved]))
+            order = argsort(planeModes, kind="mergesort")
+            positions = empty(len(order), dtype=intp)
+            positions[order] = arange(len(order))
+            planes = concatenate((self._Planes, newPlanes[:, improved]), axis=1)[:, order]
+            actions = concatenate((self._Actions, newActions[improved]))[order]
+            references = concatenate((self._References, newReferences[improved]))[order]
+            references = where(references >= 0, positions[maximum(references, 0)], -1)
+            planeModes = planeModes[order]
+
+            # Keep the vectors that are best somewhere in the belief set, the lower bound of every mode, and whatever they continue with
+            _, choices = self._Evaluate(self.Modes, self.Beliefs, planes, planeModes)
+            roots = concatenate((choices, flatnonzero(all(references < 0, axis=1))))
+            columns, self._References = _ReachablePlanes(vstack((planeModes, around(planes, 9))), references, roots)
+            self._Planes = planes[:, columns]
+            self._Actions = actions[columns]
+            self._PlaneModes = planeModes[columns]
+            iteration += 1
+
+            if residual * self._Discount / (1 - self._Discount) <= precision:
+                break
+            if timeout is not None and time.time() - startTime >= timeout:
+                break
+            if maxIterations is not None and iteration >= maxIterations:
+                break
+
+        self.Iterations = iteration
+        return self._Planes.copy(), self._Actions.copy(), self._PlaneModes.copy()
+
+'''
+Explores the belief space with random walks from the initial belief and returns the distinct points visited (one per row)
+    At each step a walk picks uniformly from the choices of where it is
+Walks are added in rounds until there are "beliefCount" distinct points, or a round finds nothing new
+
+Arguments:
+    walker -> The solver, which provides
+                  _StartWalks(walkCount)                -> (points, hidden, locations) of new walks, which all start at the initial point
+                  _WalkChoices(location)                -> The actions to pick from at a location
+                  _StepWalks(points, hidden, actions)   -> (points, hidden, locations) after taking the actions
+              'points' are what is collected (one per row), 'hidden' the true state of each walk
+              and 'locations' the (integer) part of the state that the choices depend on
+
+    rng -> Random generator for sampling the actions and trimming the points
+
+    beliefCount, beliefDepth -> See PointBasedSolver
+'''
+def _CollectPoints(walker, rng, beliefCount, beliefDepth):
+    walkCount = int(maximum(1, beliefCount // maximum(1, beliefDepth)))
+
+    choices = {}
+    collected = None
+    for attempt in range(MAX_COLLECTION_ROUNDS):
+        points, hidden, locations = walker._StartWalks(walkCount)
+        if collected is None:
+            collected = points[0:1]
+        walked = [collected]
+
+        for step in range(beliefDepth):
+            actions = empty(walkCount, dtype=intp)
+            for location in unique(locations).tolist():
+                if location not in choices:
+                    choices[location] = walker._WalkChoices(location)
+                walks = flatnonzero(locations == location)
+                actions[walks] = rng.choice(choices[location], size=len(walks))
+            points, hidden, locations = walker._StepWalks(points, hidden, actions)
+            walked.append(points)
+
+        # Drop (near) duplicate points, but always keep the initial point (the first row)
+        previousCount = len(collected)
+        collected = concatenate(walked)
+        _, firstIndices = unique(around(collected, 6), axis=0, return_index=True)
+        collected = collected[sort(firstIndices)]
+        if len(collected) >= beliefCount or len(collected) == previousCount:
+            break
+
+    if len(collected) > beliefCount:
+        kept = concatenate(([0], rng.choice(arange(1, len(collected)), size=beliefCount - 1, replace=False)))
+        collected = collected[sort(kept)]
+    return collected
+
+'''
+Merges duplicate alpha vectors and drops the ones that are not needed any more
+    A vector is kept if it is a root, or if a kept vector continues with it after some observation
+
+Arguments:
+    keys -> 2D matrix, one column per vector, equal columns are duplicates (the first copy is kept)
+
+    references -> 2D matrix, '[Vector, Observation]' the vector continued with (-1 for none)
+
+    roots -> Indices of the vectors that must be kept
+
+Returns (columns, references)
+    columns    -> Sorted indices of the kept vectors
+    references -> The references of the kept vectors, as indices into the kept vectors
+'''
+def _ReachablePlanes(keys, references, roots):
+    _, firstColumns, inverse = unique(keys, axis=1, return_index=True, return_inverse=True)
+    duplicateOf = firstColumns[inverse.ravel()]
+    references = where(references >= 0, duplicateOf[maximum(references, 0)], -1)
+
+    kept = zeros(len(duplicateOf), dtype=bool)
+    frontier = unique(duplicateOf[roots])
+    while len(frontier) > 0:
+        kept[frontier] = True
+        frontier = references[frontier].ravel()
+        frontier = unique(frontier[frontier >= 0])
+        frontier = frontier[~kept[frontier]]
+
+    columns = flatnonzero(kept)
+    newIndices = full(len(kept), -1, dtype=intp)
+    newIndices[columns] = arange(len(columns))
+    references = references[columns]
+    return columns, where(references >= 0, newIndices[maximum(references, 0)], -1)
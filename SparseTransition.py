@@ -0,0 +1,118 @@
+from numpy import *
+
+class DeterministicTransition:
+
+    '''
+    Sparse transition matrix for an action whose outcome is deterministic
+    Every start state moves to exactly one end state with probability 1
+        Most start states simply stay where they are, so only the states that move are stored
+        Memory is linear in the number of moving states instead of quadratic in the number of states
+
+    Arguments:
+        size    -> Number of states in the POMDP (the matrix is size x size)
+
+        sources -> 1D integer array of start state indices that do not transition to themselves
+
+        targets -> 1D integer array the same length as "sources"
+                   'targets[i]' is the index of the end state reached from start state 'sources[i]'
+    '''
+    def __init__(self, size, sources=(), targets=()):
+        sources = asarray(sources, dtype=intp).ravel()
+        targets = asarray(targets, dtype=intp).ravel()
+        assert sources.shape == targets.shape
+        assert len(unique(sources)) == len(sources)
+        assert all((sources >= 0) & (sources < size))
+        assert all((targets >= 0) & (targets < size))
+
+        # Keep the moving states sorted so single entries can be found with a binary search
+        order = argsort(sources, kind="mergesort")
+        self._Size = size
+        self._Sources = sources[order]
+        self._Targets = targets[order]
+
+    '''
+    Builds a transition that sends each state in the block starting at "sourceStart"
+        to the corresponding state in the block starting at "targetStart"
+    '''
+    @staticmethod
+    def Block(size, sourceStart, targetStart, length):
+        return DeterministicTransition(size, arange(sourceStart, sourceStart + length), arange(targetStart, targetStart + length))
+
+    @property
+    def shape(self):
+        return (self._Size, self._Size)
+
+    '''
+    Number of nonzero entries in the equivalent dense matrix
+    '''
+    @property
+    def nnz(self):
+        return self._Size
+
+    '''
+    Returns the probability of moving from one state to another, ie. matrix[start, end]
+    '''
+    def __getitem__(self, index):
+        start, end = index
+        return float(self.Successor(start) == end)
+
+    '''
+    Returns the index of the end state reached from the given start state
+    '''
+    def Successor(self, start):
+        position = searchsorted(self._Sources, start)
+        if position < len(self._Sources) and self._Sources[position] == start:
+            return int(self._Targets[position])
+        return start
+
+    '''
+    Returns a 1D array where the n-th value is the end state reached from the n-th state
+    '''
+    def Successors(self):
+        successors = arange(self._Size)
+        successors[self._Sources] = self._Targets
+        return successors
+
+    '''
+    Returns the start states that move and where they move to
+    '''
+    def Moves(self):
+        return self._Sources, self._Targets
+
+    '''
+    True when every state transitions to itself
+    '''
+    def IsIdentity(self):
+        return bool(all(self._Sources == self._Targets))
+
+    '''
+    Pushes a belief forward through the transition (ie. belief * matrix)
+    Accepts a single belief vector or a 2D array with one belief per row
+    '''
+    def Propagate(self, belief):
+        belief = asarray(belief)
+        result = array(belief, dtype=float, copy=True)
+        result[..., self._Sources] = 0
+        if result.ndim == 1:
+            result += bincount(self._Targets, weights=belief[self._Sources], minlength=self._Size)
+        else:
+            add.at(result, (slice(None), self._Targets), belief[:, self._Sources])
+        return result
+
+    '''
+    Pulls values on the end states back onto the start states (ie. matrix * values)
+    Accepts a single value vector or a 2D array with one row per state
+    '''
+    def Backup(self, values):
+        values = asarray(values)
+        result = array(values, copy=True)
+        result[self._Sources, ...] = values[self._Targets, ...]
+        return result
+
+    '''
+    Expands the transition into a dense matrix (for debugging small models only)
+    '''
+    def ToDense(self):
+        matrix = zeros((self._Size, self._Size))
+        matrix[arange(self._Size), self.Successors()] = 1
+        return matrix
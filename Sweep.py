@@ -0,0 +1,237 @@
+import concurrent.futures
+import csv
+import hashlib
+import itertools
+import json
+import os
+import subprocess
+import time
+from numpy import *
+import AtomicFile
+from DialogModel import DialogPOMDP, FactoredDialogPOMDP
+from Policy import Policy, FactoredPolicy
+from Simulator import Simulate
+import Solver
+
+# Bump this whenever a job's outputs change, so that stale results are never reused
+SWEEP_VERSION = 2
+
+# Default precision for external solvers, APPL's gap between its upper and lower bounds at the initial belief
+#   The in-process solvers measure precision differently and default to Solver.DEFAULT_PRECISION
+EXTERNAL_PRECISION = 0.25
+
+# Columns of the results table, in order
+COLUMNS = ["Key", "Rewards", "Discount", "ObservationMatrix", "QuestionSet", "Status", "Seconds", "Planes", "Value",
+           "Reward", "RewardStdError", "Questions", "Steps", "Accuracy", "Finished", "Error"]
+
+'''
+Builds, exports and solves every combination of the given settings, a few jobs at a time in separate processes
+Each job lives in its own directory of "outputDirectory", named after a hash of everything that affects its result
+    A job whose directory already holds a result is skipped, so an interrupted sweep simply resumes when rerun
+    Jobs whose external solver failed or had to be killed, or that raised an error, are run again unless "retryFailed" is False
+
+Arguments:
+    filename -> The dialog JSON file (see DialogPOMDP)
+
+    observeProbs -> List of observation matrices (see DialogPOMDP), ie. different amounts of noise
+                    The results table refers to them by their index in this list
+
+    outputDirectory -> Where the jobs and the results table of this sweep ("results.csv") are written
+
+    rewards -> List of reward overrides (see DialogPOMDP), None keeps the rewards of the file
+
+    discounts -> List of time discounts, None keeps the discount of the file
+
+    questionSets -> List of lists of question labels to keep, None keeps every question
+
+    precision -> Precision target of each solve
+                 None uses the default of the solver, EXTERNAL_PRECISION or Solver.DEFAULT_PRECISION
+
+    timeout -> Seconds each solve may run for (None means no limit)
+
+    workers -> Number of jobs run at once (None uses every core)
+
+    solverCommand -> None solves in-process (see Solver.py)
+                     Otherwise the command line of an external solver that takes APPL's arguments
+                         ie. ["./pomdpsol"], which is run as <command> --precision <p> --timeout <t> --output <policy> <pomdp>
+
+    factored -> Solve in-process with FactoredDialogPOMDP instead of DialogPOMDP (ignored for external solvers)
+
+    episodes -> Number of simulated episodes used to score each policy (0 skips the simulation)
+
+    seed -> Seed for the solver and the simulation
+
+    retryFailed -> Rerun jobs whose result is not "solved" (see the "Status" column), instead of reusing their result
+
+Returns the results table, a list with one dictionary per job (see COLUMNS)
+'''
+def Sweep(filename, observeProbs, outputDirectory, rewards=(None,), discounts=(None,), questionSets=(None,),
+          precision=None, timeout=None, workers=None, solverCommand=None, factored=False, episodes=10000, seed=0,
+          retryFailed=True):
+    with open(filename, "r") as filehandle:
+        model = json.load(filehandle)
+    os.makedirs(outputDirectory, exist_ok=True)
+    if precision is None:
+        precision = Solver.DEFAULT_PRECISION if solverCommand is None else EXTERNAL_PRECISION
+
+    jobs = []
+    for reward, discount, (matrixIndex, observeProb), questions in itertools.product(rewards, discounts, enumerate(observeProbs), questionSets):
+        job = {
+            "Model"             : _JobModel(model, reward, discount, questions),
+            "ObserveProb"       : asarray(observeProb, dtype=float64).tolist(),
+            "Precision"         : precision,
+            "Timeout"           : timeout,
+            "SolverCommand"     : solverCommand,
+            "Factored"          : factored and solverCommand is None,
+            "Episodes"          : episodes,
+            "Seed"              : seed,
+        }
+        key = hashlib.sha256(json.dumps([SWEEP_VERSION, job], sort_keys=True).encode()).hexdigest()[0:16]
+        job["Directory"] = os.path.join(outputDirectory, key)
+        job["Row"] = {
+            "Key"               : key,
+            "Rewards"           : json.dumps(reward, sort_keys=True),
+            "Discount"          : job["Model"]["Time Discount"],
+            "ObservationMatrix" : matrixIndex,
+            "QuestionSet"       : json.dumps(questions),
+        }
+        jobs.append(job)
+
+    # Finished jobs are read back instead of being run again
+    pending = [job for job in jobs if not _Finished(_ReadResult(job), retryFailed)]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = int(maximum(1, minimum(workers, len(pending))))
+
+    if workers <= 1:
+        for job in pending:
+            _RunJob(job)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            # Results are written by the jobs themselves, this only surfaces errors
+            for future in concurrent.futures.as_completed([pool.submit(_RunJob, job) for job in pending]):
+                future.result()
+
+    table = [_ReadResult(job) for job in jobs]
+    AtomicFile.Store(os.path.join(outputDirectory, "results.csv"), lambda temporary: _WriteTable(temporary, table))
+    return table
+
+'''
+Returns a copy of the dialog JSON with the job's settings applied
+'''
+def _JobModel(model, rewards, discount, questions):
+    model = json.loads(json.dumps(model))
+    if rewards is not None:
+        model["Rewards"].update(rewards)
+    if discount is not None:
+        model["Time Discount"] = discount
+    if questions is not None:
+        assert all([question in model["Questions"] for question in questions])
+        model["Questions"] = dict((question, model["Questions"][question]) for question in questions)
+    return model
+
+'''
+Returns the row of a finished job, or None if it has not finished
+'''
+def _ReadResult(job):
+    path = os.path.join(job["Directory"], "result.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+'''
+Returns True if a job's result (see _ReadResult) means it does not need to run again
+'''
+def _Finished(result, retryFailed):
+    if result is None:
+        return False
+    return result["Status"] == "solved" or not retryFailed
+
+'''
+Runs one job and writes its row of the results table (see _SolveJob)
+    A job that raises is recorded with the "error" status and the message in the "Error" column
+    so that one bad configuration (ie. a discount of 1 for the in-process solver) does not stop the sweep
+'''
+def _RunJob(job):
+    directory = job["Directory"]
+    os.makedirs(directory, exist_ok=True)
+
+    row = dict(job["Row"])
+    startTime = time.time()
+    try:
+        _SolveJob(job, row)
+    except Exception as error:
+        row["Status"] = "error"
+        row["Error"] = "%s: %s" % (type(error).__name__, error)
+    row["Seconds"] = time.time() - startTime
+
+    # The result is written last, so a job only counts as finished once everything else is in place
+    AtomicFile.Store(os.path.join(directory, "result.json"), lambda temporary: _WriteJSON(temporary, row))
+    return row
+
+'''
+Builds, exports and solves one configuration, then scores the policy by simulation
+    Fills in the results in "row"
+'''
+def _SolveJob(job, row):
+    directory = job["Directory"]
+    modelPath = os.path.join(directory, "model.json")
+    AtomicFile.Store(modelPath, lambda temporary: _WriteJSON(temporary, job["Model"]))
+    observeProb = array(job["ObserveProb"])
+    modelClass = FactoredDialogPOMDP if job["Factored"] else DialogPOMDP
+    dialog = modelClass(modelPath, observeProb)
+
+    if job["SolverCommand"] is None:
+        if job["Factored"]:
+            planes, actions, modes = dialog.Solve(precision=job["Precision"], timeout=job["Timeout"], seed=job["Seed"])
+            policy = FactoredPolicy(planes, actions, modes)
+            value = policy.Value(dialog.InitialMode, dialog.InitialBelief)
+            AtomicFile.Store(os.path.join(directory, "policy.npz"), lambda temporary: savez(temporary, Planes=planes, Actions=actions, Modes=modes))
+        else:
+            planes, actions = dialog.Solve(precision=job["Precision"], timeout=job["Timeout"], seed=job["Seed"])
+            policy = Policy(planes, actions)
+            value = policy.Value(asarray(dialog._InitialBelief, dtype=float))
+            AtomicFile.Store(os.path.join(directory, "policy.npz"), lambda temporary: savez(temporary, Planes=planes, Actions=actions))
+        row["Status"] = "solved"
+    else:
+        # The external solver reads the exported file
+        pomdpPath = os.path.join(directory, "model.pomdp")
+        policyPath = os.path.join(directory, "model.policy")
+        AtomicFile.Store(pomdpPath, dialog.GenerateFile)
+        command = list(job["SolverCommand"]) + ["--precision", str(job["Precision"])]
+        if job["Timeout"] is not None:
+            command += ["--timeout", str(job["Timeout"])]
+        command += ["--output", policyPath, pomdpPath]
+
+        # The solver is given some slack past its own timeout before it is killed
+        try:
+            subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True,
+                           timeout=None if job["Timeout"] is None else 2 * job["Timeout"] + 60)
+            row["Status"] = "solved"
+        except subprocess.TimeoutExpired:
+            row["Status"] = "killed"
+        except subprocess.CalledProcessError:
+            row["Status"] = "failed"
+
+        policy = None
+        if os.path.exists(policyPath):
+            policy = Policy.Load(policyPath)
+            value = policy.Value(asarray(dialog._InitialBelief, dtype=float))
+
+    if policy is not None:
+        row["Planes"] = int(policy.Planes.shape[1])
+        row["Value"] = float(value)
+        if job["Episodes"] > 0:
+            row.update(Simulate(dialog, policy, episodes=job["Episodes"], seed=job["Seed"], workers=1))
+
+def _WriteJSON(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4, sort_keys=True)
+
+def _WriteTable(path, table):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        for row in table:
+            writer.writerow(row)
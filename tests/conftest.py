@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules are run as scripts from the repository root and from ControlModel, so the tests import them the same way
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for directory in (root, os.path.join(root, "ControlModel")):
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
@@ -0,0 +1,64 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from numpy import eye, ones, random, vstack
+from BeliefTable import BeliefTable
+from ControlModel import ControlModel
+
+class BeliefTableTest(unittest.TestCase):
+
+    # Every decided cell must hold the action of the best alpha vector for any belief in it
+    def testDecidedCellsMatchPlanes(self):
+        rng = random.default_rng(0)
+        for classCount, resolution in [(2, 50), (3, 40), (4, 12)]:
+            planes = rng.normal(size=(classCount, 12))
+            table = BeliefTable(planes, range(12), resolution)
+            beliefs = vstack((rng.dirichlet(0.3 * ones(classCount), size=5000), eye(classCount)))
+            for belief in beliefs:
+                action = table.Lookup(belief)
+                if action >= 0:
+                    scores = belief @ planes
+                    self.assertGreaterEqual(scores[action], scores.max() - 1e-9)
+
+    # Confident beliefs sit right next to the simplex corners, where the control policy switches from waiting to acting
+    #   so a realistic run must be decided by the table nearly every frame
+    def testFallbackRate(self):
+        directory = tempfile.mkdtemp()
+        try:
+            rng = random.default_rng(0)
+            frequencies = [12, 17, 20]
+            recording = []
+            for frequency in frequencies:
+                data = rng.normal(1.0, 0.3, size=(30, 40, 5))
+                data[frequency] += 2.0
+                recording.append({"condition" : "%d Hz" % frequency, "data" : data.tolist()})
+            filename = os.path.join(directory, "recording.json")
+            with open(filename, "w") as f:
+                json.dump(recording, f)
+
+            # The feedback moves the decision boundaries right up to the corners
+            model = ControlModel(filename, seed=0)
+            model.UseLookupTable()
+            for fftData in self._Frames(rng, frequencies):
+                model.Update(fftData)
+            model.GiveFeedback(True)
+            model.WaitForPolicy()
+
+            model.LookupFallbacks = 0
+            for fftData in self._Frames(rng, frequencies):
+                model.Update(fftData)
+            self.assertLessEqual(model.LookupFallbacks, 15)
+        finally:
+            shutil.rmtree(directory)
+
+    # 100 frames with a clear peak at each frequency in turn
+    def _Frames(self, rng, frequencies):
+        for frame in range(300):
+            fftData = rng.normal(1.0, 0.3, size=30)
+            fftData[frequencies[frame // 100]] += 2.0
+            yield fftData
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+from numpy import full
+from ModelCache import ModelCache
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Examples", "TestQuestions.json")
+
+def ObservationMatrix(accuracy):
+    matrix = full((3, 3), (1 - accuracy) / 2)
+    matrix[[0, 1, 2], [0, 1, 2]] = accuracy
+    return matrix
+
+class ModelCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self._Directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._Directory)
+
+    def testHit(self):
+        cache = ModelCache(self._Directory)
+        model = cache.GetModel(EXAMPLE, ObservationMatrix(0.9))
+        self.assertIs(cache.GetModel(EXAMPLE, ObservationMatrix(0.9)), model)
+
+        # A new cache on the same directory reads the stored model and file instead of building them again
+        path = cache.GetFile(EXAMPLE, ObservationMatrix(0.9))
+        modified = os.path.getmtime(path)
+        other = ModelCache(self._Directory)
+        self.assertEqual(other.GetFile(EXAMPLE, ObservationMatrix(0.9)), path)
+        self.assertEqual(os.path.getmtime(path), modified)
+        self.assertEqual(other.GetModel(EXAMPLE, ObservationMatrix(0.9))._RewardMatrix.tolist(), model._RewardMatrix.tolist())
+
+    def testMiss(self):
+        cache = ModelCache(self._Directory)
+        self.assertNotEqual(cache.Key(EXAMPLE, ObservationMatrix(0.9)), cache.Key(EXAMPLE, ObservationMatrix(0.8)))
+        self.assertNotEqual(cache.Key(EXAMPLE, ObservationMatrix(0.9)), cache.Key(EXAMPLE, ObservationMatrix(0.9), {"Wait" : -1}))
+        self.assertIsNot(cache.GetModel(EXAMPLE, ObservationMatrix(0.9)), cache.GetModel(EXAMPLE, ObservationMatrix(0.8)))
+        self.assertEqual(len(os.listdir(self._Directory)), 2)
+
+    # Older entries go first once the cache is full, but the entry just built always stays
+    def testEviction(self):
+        cache = ModelCache(self._Directory, maxBytes=1)
+        keys = []
+        for index, accuracy in enumerate([0.9, 0.8, 0.7]):
+            path = cache.GetFile(EXAMPLE, ObservationMatrix(accuracy))
+            keys.append(os.path.basename(os.path.dirname(path)))
+            # Modification times only order the entries if they differ
+            os.utime(os.path.dirname(path), (index, index))
+            self.assertEqual(os.listdir(self._Directory), [keys[-1]])
+            self.assertTrue(os.path.exists(path))
+        self.assertNotIn(keys[0], cache._Models)
+
+if __name__ == "__main__":
+    unittest.main()
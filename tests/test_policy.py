@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+import unittest
+from numpy import array, array_equal
+from Policy import Policy, _ParseAPPL
+
+DENSE = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<Policy version="0.1" type="value" model="test.pomdp">
+<AlphaVector vectorLength="3" numObsValue="1" numVectors="2">
+<Vector action="1" obsValue="0">1.5 -2 0.25 </Vector>
+<Vector action="0" obsValue="0">0 1 2 </Vector>
+</AlphaVector> </Policy>
+"""
+
+SPARSE = """<?xml version="1.0" encoding="ISO-8859-1"?>
+<Policy version="0.1" type="value" model="test.pomdp">
+<AlphaVector vectorLength="3" numObsValue="1" numVectors="2">
+<SparseVector action="1" obsValue="0"><Entry>0 1.5</Entry><Entry>1 -2</Entry><Entry>2 0.25</Entry></SparseVector>
+<SparseVector action="0" obsValue="0"><Entry>1 1</Entry><Entry>2 2</Entry></SparseVector>
+</AlphaVector> </Policy>
+"""
+
+PLANES = array([[1.5, 0], [-2, 1], [0.25, 2]])
+
+class ParseAPPLTest(unittest.TestCase):
+
+    def setUp(self):
+        self._Directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._Directory)
+
+    def _Write(self, name, text):
+        path = os.path.join(self._Directory, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    # Both formats describe the same policy (missing sparse entries are zero)
+    def testFormats(self):
+        for name, text in [("dense.policy", DENSE), ("sparse.policy", SPARSE)]:
+            planes, actions = _ParseAPPL(self._Write(name, text))
+            self.assertTrue(array_equal(planes, PLANES))
+            self.assertEqual(actions.tolist(), [1, 0])
+
+    # A compiled policy is reused from the cache and gives the same answers as a fresh parse
+    def testCachedLoad(self):
+        path = self._Write("dense.policy", DENSE)
+        cacheDirectory = os.path.join(self._Directory, "cache")
+        first = Policy.Load(path, cacheDirectory)
+        second = Policy.Load(path, cacheDirectory)
+        self.assertEqual(len(os.listdir(cacheDirectory)), 2)
+        beliefs = array([[1, 0, 0], [0, 0, 1], [0.5, 0.5, 0]])
+        self.assertEqual(first.BestAction(beliefs).tolist(), [1, 0, 0])
+        self.assertTrue(array_equal(second.Value(beliefs), Policy.Load(path).Value(beliefs)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import io
+import os
+import unittest
+from numpy import allclose, array, eye, full, zeros
+from DialogModel import DialogPOMDP, FactoredDialogPOMDP
+from PomdpWriter import WritePOMDP
+from SparseTransition import DeterministicTransition
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Examples", "TestQuestions.json")
+
+# Covers every form of the writer: an identity action, one entry per state, identity with overrides,
+#   and reward rows with a nonzero default (including a 0 that overrides it)
+EXPECTED = """discount: 0.95
+values: reward
+states: s0 s1 s2 s3 s4
+actions: wait go ask
+observations: o_yes o_no
+start: 0.2 0.2 0.2 0.4 0.0
+T : wait
+identity
+T : go : s0 : s3 1
+T : go : s1 : s3 1
+T : go : s2 : s4 1
+T : go : s3 : s3 1
+T : go : s4 : s4 1
+T : ask
+identity
+T : ask : s1 : s1 0
+T : ask : s1 : s2 1
+O : *
+0.5 0.5
+0.9 0.1
+0.1 0.9
+0.5 0.5
+0.25 0.75
+R : go : * : * : * 1.5
+R : go : s1 : * : * -2.0
+R : ask : * : * : * -0.05
+R : ask : s2 : * : * 0.0
+R : ask : s3 : * : * 3.0
+"""
+
+'''
+Reads back the subset of Cassandra's format that WritePOMDP writes, returns the dense (T, O, R) matrices
+    Later entries overwrite earlier ones, as in the format
+'''
+def ReadPOMDP(text):
+    lines = iter(text.splitlines())
+    header = {}
+    for line in lines:
+        key, value = line.split(":", 1)
+        header[key] = value.split()
+        if key == "start":
+            break
+    states, actions, observations = header["states"], header["actions"], header["observations"]
+    transitions = zeros((len(actions), len(states), len(states)))
+    observationMatrix = zeros((len(states), len(observations)))
+    rewardMatrix = zeros((len(actions), len(states)))
+
+    for line in lines:
+        fields = [field.strip() for field in line.split(":")]
+        if fields[0] == "T" and len(fields) == 2:
+            assert next(lines) == "identity"
+            transitions[actions.index(fields[1])] = eye(len(states))
+        elif fields[0] == "T":
+            target, probability = fields[3].split()
+            transitions[actions.index(fields[1]), states.index(fields[2]), states.index(target)] = float(probability)
+        elif fields[0] == "O":
+            for state in range(len(states)):
+                observationMatrix[state] = [float(value) for value in next(lines).split()]
+        elif fields[0] == "R":
+            value = float(fields[4].split()[1])
+            if fields[2] == "*":
+                rewardMatrix[actions.index(fields[1])] = value
+            else:
+                rewardMatrix[actions.index(fields[1]), states.index(fields[2])] = value
+    return transitions, observationMatrix, rewardMatrix
+
+class WritePOMDPTest(unittest.TestCase):
+
+    def testExactOutput(self):
+        output = io.StringIO()
+        WritePOMDP(output, 0.95, ["s0", "s1", "s2", "s3", "s4"], ["wait", "go", "ask"], ["o_yes", "o_no"], 
+                   array([0.2, 0.2, 0.2, 0.4, 0.0]), 
+                   [DeterministicTransition(5), DeterministicTransition(5, [0, 1, 2], [3, 3, 4]), DeterministicTransition(5, [1], [2])], 
+                   array([[0.5, 0.5], [0.9, 0.1], [0.1, 0.9], [0.5, 0.5], [0.25, 0.75]]), 
+                   array([[0, 0, 0, 0, 0], [1.5, -2, 1.5, 1.5, 1.5], [-0.05, -0.05, 0, 3, -0.05]]))
+        self.assertEqual(output.getvalue(), EXPECTED)
+
+    # The exported dialog must read back as the matrices it was built from, and both forms of the model must export the same file
+    def testDialogRoundTrip(self):
+        observationMatrix = full((3, 3), 0.05)
+        observationMatrix[[0, 1, 2], [0, 1, 2]] = 0.9
+        dialog = DialogPOMDP(EXAMPLE, observationMatrix)
+        flat = io.StringIO()
+        dialog.GenerateFile(flat)
+        factored = io.StringIO()
+        FactoredDialogPOMDP(EXAMPLE, observationMatrix).GenerateFile(factored)
+        self.assertEqual(flat.getvalue(), factored.getvalue())
+
+        transitions, observations, rewards = ReadPOMDP(flat.getvalue())
+        for actionIndex, action in enumerate(dialog._Actions):
+            self.assertTrue(allclose(transitions[actionIndex], dialog._TransitionMatrix[action].ToDense()))
+        self.assertTrue(allclose(observations, dialog._ObservationMatrix))
+        self.assertTrue(allclose(rewards, dialog._RewardMatrix))
+
+if __name__ == "__main__":
+    unittest.main()
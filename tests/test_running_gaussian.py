@@ -0,0 +1,37 @@
+import unittest
+from numpy import allclose, array_split, cov, random
+from RunningGaussian import RunningGaussian
+
+class RunningGaussianTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.default_rng(0)
+        self._Samples = rng.normal(loc=[3, -1, 10], scale=[1, 0.1, 5], size=(1000, 3)) @ rng.normal(size=(3, 3))
+
+    def _AssertMatches(self, estimator):
+        self.assertEqual(estimator.Count, len(self._Samples))
+        self.assertTrue(allclose(estimator.Mean, self._Samples.mean(axis=0)))
+        self.assertTrue(allclose(estimator.Covariance(), cov(self._Samples, rowvar=False)))
+
+    def testFromChunks(self):
+        # Uneven chunks, including an empty one
+        chunks = array_split(self._Samples, [0, 1, 250, 251, 999])
+        self._AssertMatches(RunningGaussian.FromChunks(chunks, 3))
+
+    def testUpdate(self):
+        estimator = RunningGaussian(3)
+        for sample in self._Samples:
+            estimator.Update(sample)
+        self._AssertMatches(estimator)
+
+    def testMerge(self):
+        first = RunningGaussian.FromChunks([self._Samples[0:600]], 3)
+        second = RunningGaussian(3)
+        for sample in self._Samples[600:]:
+            second.Update(sample)
+        first.Merge(second)
+        first.Merge(RunningGaussian(3))
+        self._AssertMatches(first)
+
+if __name__ == "__main__":
+    unittest.main()
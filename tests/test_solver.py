@@ -0,0 +1,83 @@
+import os
+import unittest
+from numpy import allclose, array_equal, asarray, fill_diagonal, full, zeros
+from DialogModel import DialogPOMDP, FactoredDialogPOMDP
+from Policy import FactoredPolicy, Policy
+from Simulator import Simulate
+from Solver import FactoredSolver, PointBasedSolver
+
+EXAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Examples", "TestQuestions.json")
+
+'''
+Returns an observation matrix that gives the right answer with the given probability (and the others evenly)
+'''
+def NoisyIdentity(size, accuracy):
+    observationMatrix = full((size, size), (1 - accuracy) / (size - 1))
+    fill_diagonal(observationMatrix, accuracy)
+    return observationMatrix
+
+class PointBasedSolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.Dialog = DialogPOMDP(EXAMPLE, NoisyIdentity(3, 0.9))
+        self.InitialBelief = asarray(self.Dialog._InitialBelief, dtype=float)
+        self.Solver = PointBasedSolver([self.Dialog._TransitionMatrix[action] for action in self.Dialog._Actions], 
+                                       self.Dialog._ObservationMatrix, 
+                                       self.Dialog._RewardMatrix, 
+                                       self.Dialog._Model["Time Discount"], 
+                                       self.InitialBelief, 
+                                       seed=0)
+
+    # The value the policy claims at the start must be what it earns when it is followed
+    def testSimulatedReturnMatchesValue(self):
+        planes, actions = self.Solver.Solve(precision=0.25)
+        policy = Policy(planes, actions)
+        value = float(policy.Value(self.InitialBelief))
+        lowerBound = float(self.InitialBelief @ self.Solver._LowerBound()[0].max(axis=1))
+        result = Simulate(self.Dialog, policy, episodes=4000, seed=0, workers=1)
+
+        self.assertGreater(value, lowerBound)
+        self.assertGreaterEqual(result["Reward"], lowerBound)
+        self.assertGreaterEqual(result["Reward"], value - 4 * result["RewardStdError"])
+        self.assertLess(result["Reward"], value + 0.1)
+        self.assertEqual(result["Finished"], 1.0)
+
+    # Re-evaluating the stored vectors under unchanged rewards must not change them
+    def testUpdateRewardsKeepsValues(self):
+        planes, actions = self.Solver.Solve(precision=0.25)
+        self.Solver.UpdateRewards(zeros(self.Dialog._RewardMatrix.shape))
+        self.assertTrue(allclose(self.Solver._Planes, planes))
+        self.assertTrue(array_equal(self.Solver._Actions, actions))
+
+    # A warm start after a penalty still gives a policy whose value is not an overestimate
+    def testWarmStartAfterPenalty(self):
+        self.Solver.Solve(precision=0.25)
+        penalty = zeros(self.Dialog._RewardMatrix.shape)
+        penalty[self.Dialog._Actions.index("finish")] = -0.5
+        self.Solver.UpdateRewards(penalty)
+        planes, actions = self.Solver.Solve(precision=0.25)
+
+        self.Dialog._RewardMatrix = self.Dialog._RewardMatrix + penalty
+        policy = Policy(planes, actions)
+        result = Simulate(self.Dialog, policy, episodes=4000, seed=0, workers=1)
+        self.assertGreaterEqual(result["Reward"], float(policy.Value(self.InitialBelief)) - 4 * result["RewardStdError"])
+
+class FactoredSolverTest(unittest.TestCase):
+
+    # Same as PointBasedSolverTest, on the factored form of the same dialog
+    def testSimulatedReturnMatchesValue(self):
+        dialog = FactoredDialogPOMDP(EXAMPLE, NoisyIdentity(3, 0.9))
+        solver = FactoredSolver(dialog, seed=0)
+        planes, actions, modes = solver.Solve(precision=0.25)
+        policy = FactoredPolicy(planes, actions, modes)
+        value = float(policy.Value(dialog.InitialMode, asarray(dialog.InitialBelief, dtype=float)))
+        lowerBound = float(solver._LowerBound()[0].max())
+        result = Simulate(dialog, policy, episodes=4000, seed=0, workers=1)
+
+        self.assertGreater(value, lowerBound)
+        self.assertGreaterEqual(result["Reward"], lowerBound)
+        self.assertGreaterEqual(result["Reward"], value - 4 * result["RewardStdError"])
+        self.assertLess(result["Reward"], value + 0.1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+from numpy import allclose, array_equal, eye, ones, random
+from SparseTransition import DeterministicTransition
+
+class DeterministicTransitionTest(unittest.TestCase):
+
+    def setUp(self):
+        # States 2-4 move into the block at 6, state 9 moves to 0, the rest stay
+        self.Transition = DeterministicTransition(10, [2, 3, 4, 9], [6, 7, 8, 0])
+        self.Dense = eye(10)
+        for source, target in [(2, 6), (3, 7), (4, 8), (9, 0)]:
+            self.Dense[source, source] = 0
+            self.Dense[source, target] = 1
+
+    def testToDense(self):
+        self.assertTrue(array_equal(self.Transition.ToDense(), self.Dense))
+        self.assertTrue(array_equal(DeterministicTransition.Block(10, 2, 6, 3).ToDense()[2:5, 6:9], eye(3)))
+
+    def testSuccessors(self):
+        self.assertEqual(self.Transition.Successors().tolist(), self.Dense.argmax(axis=1).tolist())
+        self.assertEqual([self.Transition.Successor(state) for state in range(10)], self.Dense.argmax(axis=1).tolist())
+        self.assertEqual(self.Transition[3, 7], 1.0)
+        self.assertEqual(self.Transition[3, 3], 0.0)
+
+    def testIdentity(self):
+        self.assertTrue(DeterministicTransition(10).IsIdentity())
+        self.assertTrue(DeterministicTransition(10, [4], [4]).IsIdentity())
+        self.assertFalse(self.Transition.IsIdentity())
+
+    # Several states move into state 0 here (9 and 0 itself), so the propagated mass has to add up
+    def testPropagate(self):
+        rng = random.default_rng(0)
+        beliefs = rng.dirichlet(ones(10), size=7)
+        self.assertTrue(allclose(self.Transition.Propagate(beliefs), beliefs @ self.Dense))
+        self.assertTrue(allclose(self.Transition.Propagate(beliefs[0]), beliefs[0] @ self.Dense))
+
+    def testBackup(self):
+        rng = random.default_rng(1)
+        values = rng.normal(size=(10, 4))
+        self.assertTrue(allclose(self.Transition.Backup(values), self.Dense @ values))
+        self.assertTrue(allclose(self.Transition.Backup(values[:, 0]), self.Dense @ values[:, 0]))
+
+if __name__ == "__main__":
+    unittest.main()
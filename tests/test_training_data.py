@@ -0,0 +1,59 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from numpy import array_equal, random
+from TrainingData import Convert, DataWrapper
+
+class ConvertTest(unittest.TestCase):
+
+    def setUp(self):
+        self._Directory = tempfile.mkdtemp()
+        self._Random = random.default_rng(0)
+
+    def tearDown(self):
+        shutil.rmtree(self._Directory)
+
+    def _Path(self, name):
+        return os.path.join(self._Directory, name)
+
+    # The binary file must hold exactly what parsing the recording gives
+    def _AssertSame(self, expected, actual):
+        self.assertEqual(expected.GetFrequencies().tolist(), actual.GetFrequencies().tolist())
+        for frequency in expected.GetFrequencies().tolist():
+            self.assertTrue(array_equal(expected.GetFrequency(frequency), actual.GetFrequency(frequency)))
+            chunks = list(actual.IterateFrequency(frequency, chunkRows=7))
+            self.assertTrue(array_equal(expected.GetFrequency(frequency), [row for chunk in chunks for row in chunk]))
+
+    def testJSON(self):
+        # Conditions out of order, 20 FFT buckets, 30 time windows and 4 trials
+        recording = [{"condition" : "%d Hz" % frequency, "data" : self._Random.normal(size=(20, 30, 4)).tolist()} for frequency in [15, 8, 12]]
+        with open(self._Path("recording.json"), "w") as f:
+            json.dump(recording, f)
+
+        for windows in [None, range(0, 23)]:
+            Convert(self._Path("recording.json"), self._Path("recording.bin"), windows)
+            expected = DataWrapper(self._Path("recording.json"), windows)
+            self._AssertSame(expected, DataWrapper(self._Path("recording.bin")))
+
+        # Rows are the (trial, window) pairs and columns the buckets of the sorted conditions
+        data = DataWrapper(self._Path("recording.bin")).GetFrequency(8)
+        self.assertEqual(data.shape, (4 * 23, 3))
+        self.assertAlmostEqual(float(data[23 + 5, 2]), recording[1]["data"][15][5][1], places=5)
+
+    def testCSV(self):
+        with open(self._Path("recording.csv"), "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frequency", "12", "8", "15"])
+            for index in range(50):
+                writer.writerow([[8, 12, 15][index % 3]] + self._Random.normal(size=3).tolist())
+
+        Convert(self._Path("recording.csv"), self._Path("recording.bin"))
+        expected = DataWrapper(self._Path("recording.csv"))
+        self._AssertSame(expected, DataWrapper(self._Path("recording.bin")))
+        self.assertEqual(expected.GetFrequency(8).shape, (17, 3))
+
+if __name__ == "__main__":
+    unittest.main()